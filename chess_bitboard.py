@@ -0,0 +1,843 @@
+"""
+Bitboard backend for the rules core.
+
+BitboardPosition keeps the board as twelve piece bitboards (Python ints with
+bit 0 = a1 and bit 63 = h8) plus occupancy masks and a square-to-piece
+mailbox, and answers the rules API of chess_rules.Position that perft and the
+built-in search use: move generation, make/unmake, the Polyglot Zobrist key,
+the incremental PeSTO evaluation and the draw rules. It has no list-of-lists
+board, so the Tk game keeps using Position. Sliding attacks use hyperbola
+quintessence for files and diagonals and a first-rank lookup table for ranks.
+"""
+
+from collections import namedtuple
+
+from chess_eval import ENDGAME_SCORES, MIDGAME_SCORES, PHASE_WEIGHTS, PIECE_VALUES, taper
+from chess_rules import (START_FEN, ZOBRIST_CASTLING, ZOBRIST_EP_FILES, ZOBRIST_PIECES, ZOBRIST_WHITE_TO_MOVE,
+                         ChessPiece, Move)
+
+WHITE, BLACK = 0, 1
+COLORS = ["white", "black"]
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_NAMES = ["pawn", "knight", "bishop", "rook", "queen", "king"]
+PIECE_TYPES = {name: piece_type for piece_type, name in enumerate(PIECE_NAMES)}
+FEN_SYMBOLS = "pnbrqk"
+
+FULL = (1 << 64) - 1
+
+# Castling rights bits
+CASTLE_WHITE_KINGSIDE = 1
+CASTLE_WHITE_QUEENSIDE = 2
+CASTLE_BLACK_KINGSIDE = 4
+CASTLE_BLACK_QUEENSIDE = 8
+CASTLING_SYMBOLS = [(CASTLE_WHITE_KINGSIDE, "K"), (CASTLE_WHITE_QUEENSIDE, "Q"),
+                    (CASTLE_BLACK_KINGSIDE, "k"), (CASTLE_BLACK_QUEENSIDE, "q")]
+
+
+def square_of(row, col):
+    """Convert a (row, col) board coordinate, row 0 being rank 8, to a square index"""
+    return (7 - row) * 8 + col
+
+
+# Square index -> (row, col) coordinate
+COORDS = [(7 - square // 8, square % 8) for square in range(64)]
+
+
+def _bits(bitboard):
+    """Yield the square index of every set bit"""
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+def _bswap(bitboard):
+    """Mirror a bitboard vertically (rank 1 <-> rank 8)"""
+    return int.from_bytes(bitboard.to_bytes(8, "big"), "little")
+
+
+def _offset_table(offsets):
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        bitboard = 0
+        for rank_step, file_step in offsets:
+            r, f = rank + rank_step, file + file_step
+            if 0 <= r < 8 and 0 <= f < 8:
+                bitboard |= 1 << (r * 8 + f)
+        table.append(bitboard)
+    return table
+
+
+def _line_mask_table(rank_step, file_step):
+    """For each square, the line through it in both directions, excluding the square"""
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        bitboard = 0
+        for sign in (1, -1):
+            r, f = rank + sign * rank_step, file + sign * file_step
+            while 0 <= r < 8 and 0 <= f < 8:
+                bitboard |= 1 << (r * 8 + f)
+                r, f = r + sign * rank_step, f + sign * file_step
+        table.append(bitboard)
+    return table
+
+
+def _between_table():
+    """For each pair of squares on a shared line, the squares strictly between them"""
+    table = [[0] * 64 for _ in range(64)]
+    for origin in range(64):
+        rank, file = divmod(origin, 8)
+        for rank_step, file_step in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            between = 0
+            r, f = rank + rank_step, file + file_step
+            while 0 <= r < 8 and 0 <= f < 8:
+                table[origin][r * 8 + f] = between
+                between |= 1 << (r * 8 + f)
+                r, f = r + rank_step, f + file_step
+    return table
+
+
+def _first_rank_attacks():
+    """Attacks along a single rank for each slider file and 8-bit rank occupancy"""
+    table = []
+    for file in range(8):
+        row = []
+        for occupied in range(256):
+            attacks = 0
+            for step in (1, -1):
+                f = file + step
+                while 0 <= f < 8:
+                    attacks |= 1 << f
+                    if occupied & (1 << f):
+                        break
+                    f += step
+            row.append(attacks)
+        table.append(row)
+    return table
+
+
+def _castling_zobrist_table():
+    """Zobrist term of each set of castling rights"""
+    table = []
+    for rights in range(16):
+        key = 0
+        for bit, symbol in CASTLING_SYMBOLS:
+            if rights & bit:
+                key ^= ZOBRIST_CASTLING[symbol]
+        table.append(key)
+    return table
+
+
+KNIGHT_ATTACKS = _offset_table([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _offset_table([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+PAWN_ATTACKS = [_offset_table([(1, -1), (1, 1)]), _offset_table([(-1, -1), (-1, 1)])]
+FILE_MASKS = _line_mask_table(1, 0)
+RANK_MASKS = _line_mask_table(0, 1)
+DIAGONAL_MASKS = _line_mask_table(1, 1)
+ANTI_DIAGONAL_MASKS = _line_mask_table(1, -1)
+FIRST_RANK_ATTACKS = _first_rank_attacks()
+BETWEEN = _between_table()
+ROOK_RAYS = [FILE_MASKS[square] | RANK_MASKS[square] for square in range(64)]
+BISHOP_RAYS = [DIAGONAL_MASKS[square] | ANTI_DIAGONAL_MASKS[square] for square in range(64)]
+SQUARE_BITS = [1 << square for square in range(64)]
+MIRRORED_BITS = [1 << (square ^ 56) for square in range(64)]
+
+# Castling rights that survive a move touching each square
+CASTLING_KEEP = [0b1111] * 64
+CASTLING_KEEP[0] &= ~CASTLE_WHITE_QUEENSIDE
+CASTLING_KEEP[4] &= ~(CASTLE_WHITE_KINGSIDE | CASTLE_WHITE_QUEENSIDE)
+CASTLING_KEEP[7] &= ~CASTLE_WHITE_KINGSIDE
+CASTLING_KEEP[56] &= ~CASTLE_BLACK_QUEENSIDE
+CASTLING_KEEP[60] &= ~(CASTLE_BLACK_KINGSIDE | CASTLE_BLACK_QUEENSIDE)
+CASTLING_KEEP[63] &= ~CASTLE_BLACK_KINGSIDE
+
+# Piece tables indexed by piece code and square; square ^ 56 is the row * 8 + col index of chess_rules
+PIECES = [ChessPiece(COLORS[code // 6], PIECE_NAMES[code % 6]) for code in range(12)]
+PIECE_ZOBRIST = [[ZOBRIST_PIECES[piece.color][piece.name][square ^ 56] for square in range(64)] for piece in PIECES]
+PIECE_MIDGAME = [[MIDGAME_SCORES[piece.color][piece.name][square ^ 56] for square in range(64)] for piece in PIECES]
+PIECE_ENDGAME = [[ENDGAME_SCORES[piece.color][piece.name][square ^ 56] for square in range(64)] for piece in PIECES]
+PIECE_PHASES = [PHASE_WEIGHTS[piece.name] for piece in PIECES]
+PIECE_MATERIAL = [PIECE_VALUES[piece.name] for piece in PIECES]
+CASTLING_ZOBRIST = _castling_zobrist_table()
+
+# What make_move changes beyond the board, which _make and _unmake handle
+BitboardUndo = namedtuple("BitboardUndo", [
+    "board", "last_move", "key", "legal_moves", "legal_targets", "scores",
+])
+
+
+def _line_attacks(occupied, square, mask):
+    """Hyperbola quintessence: sliding attacks along one file or diagonal"""
+    forward = occupied & mask
+    reverse = _bswap(forward)
+    forward -= SQUARE_BITS[square] << 1
+    reverse -= MIRRORED_BITS[square] << 1
+    return (forward ^ _bswap(reverse & FULL)) & mask
+
+
+def rook_attacks(square, occupied):
+    shift = square & 56
+    rank_attacks = FIRST_RANK_ATTACKS[square & 7][(occupied >> shift) & 0xFF] << shift
+    return rank_attacks | _line_attacks(occupied, square, FILE_MASKS[square])
+
+
+def bishop_attacks(square, occupied):
+    return (_line_attacks(occupied, square, DIAGONAL_MASKS[square]) |
+            _line_attacks(occupied, square, ANTI_DIAGONAL_MASKS[square]))
+
+
+class BitboardPosition:
+    """
+    Board state as piece bitboards, with the rules API of Position apart
+    from the board list. Pieces are coded as color * 6 + piece type; moves
+    are chess_rules.Move tuples with (row, col) squares, and piece_at()
+    returns ChessPiece objects, so perft and the search can run either
+    backend.
+    """
+
+    board_size = 8
+
+    def __init__(self):
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.mailbox = [None] * 64
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.last_move = None
+        self.key = 0
+        self.key_history = []  # Zobrist keys of every position reached, current one last
+        self.move_history = []  # BitboardUndo records of the moves played so far
+        # Evaluation sums kept up to date by make_move, positive for white
+        self.midgame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        self.material = {"white": 0, "black": 0}
+        # Legal moves of the side to move, built on first use and cleared by a move
+        self._legal_moves = None
+        self._legal_targets = None
+
+    @classmethod
+    def starting_position(cls):
+        return cls.from_fen(START_FEN)
+
+    @classmethod
+    def from_fen(cls, fen):
+        position = cls()
+        fields = fen.split()
+        for row, rank_text in enumerate(fields[0].split("/")):
+            col = 0
+            for symbol in rank_text:
+                if symbol.isdigit():
+                    col += int(symbol)
+                    continue
+                color = WHITE if symbol.isupper() else BLACK
+                position._put(square_of(row, col), color * 6 + FEN_SYMBOLS.index(symbol.lower()))
+                col += 1
+        position.side = WHITE if len(fields) < 2 or fields[1] == "w" else BLACK
+        if len(fields) > 2:
+            for bit, symbol in CASTLING_SYMBOLS:
+                if symbol in fields[2]:
+                    position.castling |= bit
+        if len(fields) > 3 and fields[3] != "-":
+            position.ep_square = square_of(8 - int(fields[3][1]), ord(fields[3][0]) - ord("a"))
+        if len(fields) > 5:
+            position.halfmove_clock = int(fields[4])
+            position.fullmove_number = int(fields[5])
+        position.key = position.compute_key()
+        position.key_history = [position.key]
+        position.compute_scores()
+        return position
+
+    def fen(self):
+        rows = []
+        for row in range(8):
+            empty = 0
+            row_fen = ""
+            for col in range(8):
+                code = self.mailbox[square_of(row, col)]
+                if code is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row_fen += str(empty)
+                    empty = 0
+                symbol = FEN_SYMBOLS[code % 6]
+                row_fen += symbol.upper() if code < 6 else symbol
+            if empty:
+                row_fen += str(empty)
+            rows.append(row_fen)
+        castling = "".join(symbol for bit, symbol in CASTLING_SYMBOLS if self.castling & bit) or "-"
+        if self.ep_square is None:
+            ep = "-"
+        else:
+            row, col = COORDS[self.ep_square]
+            ep = f"{chr(ord('a') + col)}{8 - row}"
+        return (f"{'/'.join(rows)} {'w' if self.side == WHITE else 'b'} {castling} {ep} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    board_to_fen = fen
+
+    @property
+    def current_player(self):
+        return COLORS[self.side]
+
+    @property
+    def castling_rights(self):
+        return "".join(symbol for bit, symbol in CASTLING_SYMBOLS if self.castling & bit)
+
+    def _put(self, square, code):
+        self.bitboards[code] |= SQUARE_BITS[square]
+        self.occupancy[code // 6] |= SQUARE_BITS[square]
+        self.mailbox[square] = code
+
+    def piece_at(self, square):
+        """The ChessPiece on a (row, col) square, or None"""
+        code = self.mailbox[square_of(*square)]
+        return PIECES[code] if code is not None else None
+
+    def remove_piece(self, square):
+        """
+        Lift the piece off a (row, col) square and return it, for probing the
+        board. The key and evaluation are not updated: put it back with
+        put_piece before the next move.
+        """
+        index = square_of(*square)
+        code = self.mailbox[index]
+        self.bitboards[code] ^= SQUARE_BITS[index]
+        self.occupancy[code // 6] ^= SQUARE_BITS[index]
+        self.mailbox[index] = None
+        return PIECES[code]
+
+    def put_piece(self, square, piece):
+        """Put back a piece lifted by remove_piece"""
+        self._put(square_of(*square), self._color_index(piece.color) * 6 + PIECE_TYPES[piece.name])
+
+    # Hashing and evaluation
+
+    def _ep_key(self):
+        """
+        Zobrist term for the en passant square. As in Polyglot, it only counts
+        when a pawn of the side to move stands ready to capture.
+        """
+        ep_square = self.ep_square
+        if ep_square is not None and PAWN_ATTACKS[self.side ^ 1][ep_square] & self.bitboards[self.side * 6 + PAWN]:
+            return ZOBRIST_EP_FILES[ep_square & 7]
+        return 0
+
+    def compute_key(self):
+        """Compute the Zobrist key of the position from scratch; equal to Position.key"""
+        key = CASTLING_ZOBRIST[self.castling] ^ self._ep_key()
+        for square, code in enumerate(self.mailbox):
+            if code is not None:
+                key ^= PIECE_ZOBRIST[code][square]
+        if self.side == WHITE:
+            key ^= ZOBRIST_WHITE_TO_MOVE
+        return key
+
+    def compute_scores(self):
+        """Compute the material, phase and piece-square sums from scratch"""
+        self.midgame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        self.material = {"white": 0, "black": 0}
+        for square, code in enumerate(self.mailbox):
+            if code is not None:
+                self.midgame_score += PIECE_MIDGAME[code][square]
+                self.endgame_score += PIECE_ENDGAME[code][square]
+                self.phase += PIECE_PHASES[code]
+                self.material[COLORS[code // 6]] += PIECE_MATERIAL[code]
+
+    def evaluate(self):
+        """Static evaluation in centipawns, positive favors white"""
+        return taper(self.midgame_score, self.endgame_score, self.phase)
+
+    def _color_index(self, color):
+        if color is None:
+            return self.side
+        return WHITE if color == "white" else BLACK
+
+    # Attack detection
+
+    def _is_attacked(self, square, by):
+        """Check if the given square is attacked by color index by"""
+        bitboards = self.bitboards
+        base = by * 6
+        if KNIGHT_ATTACKS[square] & bitboards[base + KNIGHT]:
+            return True
+        if PAWN_ATTACKS[by ^ 1][square] & bitboards[base + PAWN]:
+            return True
+        if KING_ATTACKS[square] & bitboards[base + KING]:
+            return True
+        queens = bitboards[base + QUEEN]
+        occupied = self.occupancy[0] | self.occupancy[1]
+        rooks = bitboards[base + ROOK] | queens
+        if ROOK_RAYS[square] & rooks and rook_attacks(square, occupied) & rooks:
+            return True
+        bishops = bitboards[base + BISHOP] | queens
+        if BISHOP_RAYS[square] & bishops and bishop_attacks(square, occupied) & bishops:
+            return True
+        return False
+
+    def is_square_attacked(self, square, by_color):
+        """Check if any piece of by_color attacks the (row, col) square"""
+        return self._is_attacked(square_of(*square), self._color_index(by_color))
+
+    def find_king(self, color):
+        king = self.bitboards[self._color_index(color) * 6 + KING]
+        return COORDS[king.bit_length() - 1] if king else None
+
+    def is_in_check(self, color=None):
+        us = self._color_index(color)
+        king = self.bitboards[us * 6 + KING]
+        return bool(king) and self._is_attacked(king.bit_length() - 1, us ^ 1)
+
+    def get_attackers(self, square, by_color):
+        """Yield the (row, col) squares of the pieces of by_color that attack the given square"""
+        target = square_of(*square)
+        bitboards = self.bitboards
+        by = self._color_index(by_color)
+        base = by * 6
+        occupied = self.occupancy[0] | self.occupancy[1]
+        attackers = ((KNIGHT_ATTACKS[target] & bitboards[base + KNIGHT]) |
+                     (PAWN_ATTACKS[by ^ 1][target] & bitboards[base + PAWN]) |
+                     (KING_ATTACKS[target] & bitboards[base + KING]))
+        queens = bitboards[base + QUEEN]
+        rooks = bitboards[base + ROOK] | queens
+        if ROOK_RAYS[target] & rooks:
+            attackers |= rook_attacks(target, occupied) & rooks
+        bishops = bitboards[base + BISHOP] | queens
+        if BISHOP_RAYS[target] & bishops:
+            attackers |= bishop_attacks(target, occupied) & bishops
+        for origin in _bits(attackers):
+            yield COORDS[origin]
+
+    # Move generation
+
+    def _pseudo_legal_moves(self, us):
+        """Yield (from, to, promotion type or None) for the pseudo-legal moves of us"""
+        bitboards = self.bitboards
+        base = us * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[us ^ 1]
+        occupied = own | enemy
+        not_own = ~own & FULL
+
+        # Pawns
+        step = 8 if us == WHITE else -8
+        start_rank = 1 if us == WHITE else 6
+        last_rank = 7 if us == WHITE else 0
+        targets = enemy
+        if self.ep_square is not None:
+            targets |= SQUARE_BITS[self.ep_square]
+        for origin in _bits(bitboards[base + PAWN]):
+            destinations = []
+            to = origin + step
+            if not occupied & SQUARE_BITS[to]:
+                destinations.append(to)
+                if origin >> 3 == start_rank and not occupied & SQUARE_BITS[to + step]:
+                    destinations.append(to + step)
+            destinations.extend(_bits(PAWN_ATTACKS[us][origin] & targets))
+            for to in destinations:
+                if to >> 3 == last_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        yield origin, to, promotion
+                else:
+                    yield origin, to, None
+
+        for origin in _bits(bitboards[base + KNIGHT]):
+            for to in _bits(KNIGHT_ATTACKS[origin] & not_own):
+                yield origin, to, None
+
+        queens = bitboards[base + QUEEN]
+        for origin in _bits(bitboards[base + BISHOP] | queens):
+            for to in _bits(bishop_attacks(origin, occupied) & not_own):
+                yield origin, to, None
+        for origin in _bits(bitboards[base + ROOK] | queens):
+            for to in _bits(rook_attacks(origin, occupied) & not_own):
+                yield origin, to, None
+
+        king = bitboards[base + KING]
+        if king:
+            origin = king.bit_length() - 1
+            for to in _bits(KING_ATTACKS[origin] & not_own):
+                yield origin, to, None
+
+            # Castling: rights, an empty path and a king that never crosses an attack
+            rights = self.castling >> (2 * us)
+            home = 0 if us == WHITE else 56
+            rook = base + ROOK
+            if rights & 3 and origin == home + 4 and not self._is_attacked(origin, us ^ 1):
+                if (rights & 1 and self.mailbox[home + 7] == rook
+                        and not occupied & (SQUARE_BITS[home + 5] | SQUARE_BITS[home + 6])
+                        and not self._is_attacked(home + 5, us ^ 1)
+                        and not self._is_attacked(home + 6, us ^ 1)):
+                    yield origin, home + 6, None
+                if (rights & 2 and self.mailbox[home] == rook
+                        and not occupied & (SQUARE_BITS[home + 1] | SQUARE_BITS[home + 2] |
+                                            SQUARE_BITS[home + 3])
+                        and not self._is_attacked(home + 3, us ^ 1)
+                        and not self._is_attacked(home + 2, us ^ 1)):
+                    yield origin, home + 2, None
+
+    def _pinned(self, us, king_square):
+        """Bitboard of the pieces of us pinned against their king"""
+        bitboards = self.bitboards
+        base = (us ^ 1) * 6
+        queens = bitboards[base + QUEEN]
+        snipers = ((ROOK_RAYS[king_square] & (bitboards[base + ROOK] | queens)) |
+                   (BISHOP_RAYS[king_square] & (bitboards[base + BISHOP] | queens)))
+        occupied = self.occupancy[0] | self.occupancy[1]
+        pinned = 0
+        for sniper in _bits(snipers):
+            blockers = BETWEEN[king_square][sniper] & occupied
+            # Exactly one blocker, and it belongs to us
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers & self.occupancy[us]
+        return pinned
+
+    def _legal(self, us):
+        """
+        Filter pseudo-legal moves. Outside of check only king moves, moves of
+        pinned pieces and en passant captures can expose the king, so only
+        those are played and tested.
+        """
+        king = self.bitboards[us * 6 + KING]
+        if not king:
+            return list(self._pseudo_legal_moves(us))
+        king_square = king.bit_length() - 1
+        if self._is_attacked(king_square, us ^ 1):
+            suspect = FULL
+        else:
+            suspect = self._pinned(us, king_square) | king
+        ep_square = self.ep_square
+        pawns = self.bitboards[us * 6 + PAWN]
+
+        legal = []
+        for move in self._pseudo_legal_moves(us):
+            origin = move[0]
+            origin_bit = SQUARE_BITS[origin]
+            if not suspect & origin_bit and not (move[1] == ep_square and pawns & origin_bit):
+                legal.append(move)
+                continue
+            undo = self._make(*move)
+            king = self.bitboards[us * 6 + KING]
+            if not self._is_attacked(king.bit_length() - 1, us ^ 1):
+                legal.append(move)
+            self._unmake(undo)
+        return legal
+
+    def generate_pseudo_legal_moves(self, color=None):
+        """Yield the pseudo-legal moves of the given color, defaulting to the side to move"""
+        for origin, to, promotion in self._pseudo_legal_moves(self._color_index(color)):
+            yield Move(COORDS[origin], COORDS[to],
+                       PIECE_NAMES[promotion] if promotion is not None else None)
+
+    def generate_legal_moves(self, color=None):
+        """Yield the legal moves for the given color, defaulting to the side to move"""
+        for origin, to, promotion in self._legal(self._color_index(color)):
+            yield Move(COORDS[origin], COORDS[to],
+                       PIECE_NAMES[promotion] if promotion is not None else None)
+
+    def captured_piece(self, move):
+        """The piece a move captures, including a pawn taken en passant, or None"""
+        origin = square_of(*move.start)
+        to = square_of(*move.end)
+        code = self.mailbox[to]
+        if code is None and to == self.ep_square and self.mailbox[origin] % 6 == PAWN:
+            code = self.mailbox[(origin & 56) | (to & 7)]
+        return PIECES[code] if code is not None else None
+
+    def is_legal(self, move):
+        """Check that a pseudo-legal move does not leave the mover's king in check"""
+        origin = square_of(*move.start)
+        to = square_of(*move.end)
+        code = self.mailbox[origin]
+        # Castling candidates are already validated by the generator
+        if code % 6 == KING and abs(to - origin) == 2:
+            return True
+        us = code // 6
+        undo = self._make(origin, to, None)
+        king = self.bitboards[us * 6 + KING]
+        in_check = bool(king) and self._is_attacked(king.bit_length() - 1, us ^ 1)
+        self._unmake(undo)
+        return not in_check
+
+    def legal_moves(self):
+        """
+        The legal moves of the side to move. Generated once per position and
+        reused until the position changes.
+        """
+        if self._legal_moves is None:
+            self._legal_moves = list(self.generate_legal_moves())
+            self._legal_targets = None
+        return self._legal_moves
+
+    def legal_targets(self):
+        """Map each start square of the side to move to its legal target squares"""
+        if self._legal_targets is None:
+            targets = {}
+            for move in self.legal_moves():
+                ends = targets.setdefault(move.start, [])
+                # Promotions produce one move per piece for the same target square
+                if move.end not in ends:
+                    ends.append(move.end)
+            self._legal_targets = targets
+        return self._legal_targets
+
+    def is_valid_basic_move(self, start, end):
+        """Check that the piece on start may move to end by its movement rules, ignoring checks"""
+        if not all(0 <= coordinate < 8 for coordinate in (*start, *end)):
+            return False
+        origin = square_of(*start)
+        to = square_of(*end)
+        code = self.mailbox[origin]
+        if code is None:
+            return False
+        return any(move[0] == origin and move[1] == to for move in self._pseudo_legal_moves(code // 6))
+
+    def get_valid_moves(self, start):
+        """Get all valid target squares for a piece at the given position"""
+        if not start:
+            return []
+        origin = square_of(*start)
+        code = self.mailbox[origin]
+        if code is None:
+            return []
+        valid_moves = []
+        for move_origin, to, _ in self._legal(code // 6):
+            if move_origin == origin and COORDS[to] not in valid_moves:
+                valid_moves.append(COORDS[to])
+        return valid_moves
+
+    def is_valid_move(self, start, end):
+        if not start or not end:
+            return False
+        return tuple(end) in self.get_valid_moves(start)
+
+    def has_valid_moves(self, color):
+        if color == self.current_player:
+            return bool(self.legal_moves())
+        return bool(self._legal(self._color_index(color)))
+
+    def is_checkmate(self, color):
+        return self.is_in_check(color) and not self.has_valid_moves(color)
+
+    def is_stalemate(self, color):
+        return not self.is_in_check(color) and not self.has_valid_moves(color)
+
+    # Making and unmaking moves
+
+    def _make(self, origin, to, promotion):
+        """Play a move given as square indexes and return the record needed to undo it"""
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        mailbox = self.mailbox
+        code = mailbox[origin]
+        us = code // 6
+        piece_type = code - us * 6
+        captured_square = to
+        if piece_type == PAWN and to == self.ep_square:
+            captured_square = to - 8 if us == WHITE else to + 8
+        captured = mailbox[captured_square]
+        undo = (origin, to, promotion, code, captured, captured_square,
+                self.castling, self.ep_square, self.halfmove_clock, self.side)
+
+        if captured is not None:
+            bit = SQUARE_BITS[captured_square]
+            bitboards[captured] ^= bit
+            occupancy[us ^ 1] ^= bit
+            mailbox[captured_square] = None
+
+        origin_bit = SQUARE_BITS[origin]
+        to_bit = SQUARE_BITS[to]
+        placed = code if promotion is None else us * 6 + promotion
+        bitboards[code] ^= origin_bit
+        bitboards[placed] |= to_bit
+        occupancy[us] ^= origin_bit | to_bit
+        mailbox[origin] = None
+        mailbox[to] = placed
+
+        if piece_type == KING and abs(to - origin) == 2:
+            # Move the castling rook
+            if to > origin:
+                rook_from, rook_to = origin + 3, origin + 1
+            else:
+                rook_from, rook_to = origin - 4, origin - 1
+            rook_bits = SQUARE_BITS[rook_from] | SQUARE_BITS[rook_to]
+            bitboards[us * 6 + ROOK] ^= rook_bits
+            occupancy[us] ^= rook_bits
+            mailbox[rook_to] = mailbox[rook_from]
+            mailbox[rook_from] = None
+
+        self.castling &= CASTLING_KEEP[origin] & CASTLING_KEEP[to]
+        if piece_type == PAWN and abs(to - origin) == 16:
+            self.ep_square = (origin + to) // 2
+        else:
+            self.ep_square = None
+        if piece_type == PAWN or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if us == BLACK:
+            self.fullmove_number += 1
+        self.side = us ^ 1
+        return undo
+
+    def _unmake(self, undo):
+        origin, to, promotion, code, captured, captured_square, castling, ep_square, halfmove, side = undo
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        mailbox = self.mailbox
+        us = code // 6
+
+        origin_bit = SQUARE_BITS[origin]
+        to_bit = SQUARE_BITS[to]
+        placed = mailbox[to]
+        bitboards[placed] ^= to_bit
+        bitboards[code] |= origin_bit
+        occupancy[us] ^= origin_bit | to_bit
+        mailbox[to] = None
+        mailbox[origin] = code
+
+        if captured is not None:
+            bit = SQUARE_BITS[captured_square]
+            bitboards[captured] |= bit
+            occupancy[us ^ 1] |= bit
+            mailbox[captured_square] = captured
+
+        if code - us * 6 == KING and abs(to - origin) == 2:
+            if to > origin:
+                rook_from, rook_to = origin + 3, origin + 1
+            else:
+                rook_from, rook_to = origin - 4, origin - 1
+            rook_bits = SQUARE_BITS[rook_from] | SQUARE_BITS[rook_to]
+            bitboards[us * 6 + ROOK] ^= rook_bits
+            occupancy[us] ^= rook_bits
+            mailbox[rook_from] = mailbox[rook_to]
+            mailbox[rook_to] = None
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove
+        if us == BLACK:
+            self.fullmove_number -= 1
+        # Not always us: legality tests also play moves of the side not to move
+        self.side = side
+
+    def make_move(self, move):
+        """
+        Play a pseudo-legal move and pass the turn, updating the key and the
+        evaluation. Returns the BitboardUndo that unmake_move needs.
+        A pawn reaching the last rank becomes the promotion piece, a queen by default.
+        """
+        origin = square_of(*move.start)
+        to = square_of(*move.end)
+        code = self.mailbox[origin]
+        is_promotion = code % 6 == PAWN and to >> 3 in (0, 7)
+        material = self.material
+        scores = (self.midgame_score, self.endgame_score, self.phase, material["white"], material["black"])
+        undo = BitboardUndo(None, self.last_move, self.key, self._legal_moves, self._legal_targets, scores)
+        key = self.key ^ self._ep_key() ^ CASTLING_ZOBRIST[self.castling] ^ ZOBRIST_WHITE_TO_MOVE
+
+        board_undo = self._make(origin, to, PIECE_TYPES[move.promotion or "queen"] if is_promotion else None)
+        captured, captured_square = board_undo[4], board_undo[5]
+        placed = self.mailbox[to]
+        key ^= PIECE_ZOBRIST[code][origin] ^ PIECE_ZOBRIST[placed][to]
+        midgame = self.midgame_score + PIECE_MIDGAME[placed][to] - PIECE_MIDGAME[code][origin]
+        endgame = self.endgame_score + PIECE_ENDGAME[placed][to] - PIECE_ENDGAME[code][origin]
+        if placed != code:
+            self.phase += PIECE_PHASES[placed] - PIECE_PHASES[code]
+            material[COLORS[code // 6]] += PIECE_MATERIAL[placed] - PIECE_MATERIAL[code]
+        if captured is not None:
+            key ^= PIECE_ZOBRIST[captured][captured_square]
+            midgame -= PIECE_MIDGAME[captured][captured_square]
+            endgame -= PIECE_ENDGAME[captured][captured_square]
+            self.phase -= PIECE_PHASES[captured]
+            material[COLORS[captured // 6]] -= PIECE_MATERIAL[captured]
+        if code % 6 == KING and abs(to - origin) == 2:
+            rook = code - KING + ROOK
+            rook_from, rook_to = (origin + 3, origin + 1) if to > origin else (origin - 4, origin - 1)
+            key ^= PIECE_ZOBRIST[rook][rook_from] ^ PIECE_ZOBRIST[rook][rook_to]
+            midgame += PIECE_MIDGAME[rook][rook_to] - PIECE_MIDGAME[rook][rook_from]
+            endgame += PIECE_ENDGAME[rook][rook_to] - PIECE_ENDGAME[rook][rook_from]
+        self.midgame_score, self.endgame_score = midgame, endgame
+
+        undo = undo._replace(board=board_undo)
+        self._legal_moves = None
+        self._legal_targets = None
+        self.last_move = (move.start, move.end)
+        self.move_history.append(undo)
+        self.key = key ^ CASTLING_ZOBRIST[self.castling] ^ self._ep_key()
+        self.key_history.append(self.key)
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back the most recent make_move using its BitboardUndo"""
+        self._unmake(undo.board)
+        self.move_history.pop()
+        self.key_history.pop()
+        self.key = undo.key
+        self.last_move = undo.last_move
+        self._legal_moves = undo.legal_moves
+        self._legal_targets = undo.legal_targets
+        (self.midgame_score, self.endgame_score, self.phase,
+         self.material["white"], self.material["black"]) = undo.scores
+
+    def move_piece(self, start, end, promotion="queen"):
+        """
+        Play a move that has already been validated and pass the turn.
+        A pawn reaching the last rank is replaced by the promotion piece.
+        """
+        return self.make_move(Move(start, end, promotion))
+
+    # Draw rules
+
+    def repetition_count(self):
+        """
+        Count how often the current position has occurred. Only positions since
+        the last pawn move or capture can repeat, so the key history is scanned
+        no further back than the halfmove clock.
+        """
+        history = self.key_history
+        last = len(history) - 1
+        earliest = max(0, last - self.halfmove_clock)
+        count = 1
+        for index in range(last - 2, earliest - 1, -2):
+            if history[index] == self.key:
+                count += 1
+        return count
+
+    def is_threefold_repetition(self):
+        """Check if the current position has occurred three times"""
+        return self.repetition_count() >= 3
+
+    def is_fifty_move_rule(self):
+        """Check if fifty moves have been made without pawn movement or capture"""
+        return self.halfmove_clock >= 100
+
+    def is_insufficient_material(self):
+        """Check that neither side has more than a single knight or bishop besides the king"""
+        bitboards = self.bitboards
+        for base in (WHITE * 6, BLACK * 6):
+            if bitboards[base + PAWN] | bitboards[base + ROOK] | bitboards[base + QUEEN]:
+                return False
+            minors = bitboards[base + KNIGHT] | bitboards[base + BISHOP]
+            if minors & (minors - 1):
+                return False
+        return True
+
+    def is_dead_position(self):
+        """Check if the position is dead: king against king, alone or with one knight or bishop"""
+        counts = [bin(occupancy).count("1") for occupancy in self.occupancy]
+        if counts == [1, 1]:
+            return True
+        for us in (WHITE, BLACK):
+            minors = self.bitboards[us * 6 + KNIGHT] | self.bitboards[us * 6 + BISHOP]
+            if counts[us] == 2 and counts[us ^ 1] == 1 and minors:
+                return True
+        return False
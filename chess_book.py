@@ -0,0 +1,330 @@
+"""
+Polyglot opening book probe.
+
+A Polyglot .bin book is a file of 16-byte big-endian entries (key, move,
+weight, learn) sorted by the Zobrist key of the position. The file is
+memory-mapped and binary-searched, so probing costs a few page reads and the
+book is never loaded into memory. Position.key uses the Polyglot Zobrist
+numbers, so it can be looked up directly.
+
+Books are built from PGN archives with the build-book command:
+
+    python chess_book.py build-book games.pgn more.pgn -o book.bin --max-ply 20
+
+The PGN files are split into chunks at game boundaries and replayed with
+python-chess in parallel worker processes. Each worker counts moves in a
+dictionary of bounded size and writes it out as a sorted run file whenever
+it fills up. The runs are then merged in key order into the book, at most
+MERGE_FAN_IN of them at a time, so neither memory use nor the number of open
+files grows with the size of the archive.
+"""
+
+import argparse
+import heapq
+import io
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from chess_rules import Move
+
+ENTRY = struct.Struct(">QHHI")  # key, move, weight, learn
+RUN_RECORD = struct.Struct(">QHII")  # key, move, score, games
+MERGE_FAN_IN = 64  # Run files open at once while merging
+
+# Promotion piece codes of a Polyglot move
+PROMOTION_NAMES = {1: "knight", 2: "bishop", 3: "rook", 4: "queen"}
+PROMOTION_CODES = {chess.KNIGHT: 1, chess.BISHOP: 2, chess.ROOK: 3, chess.QUEEN: 4}
+
+# Score of a book move for the side that played it, by game result
+RESULT_SCORES = {
+    "1-0": {chess.WHITE: 2, chess.BLACK: 0},
+    "0-1": {chess.WHITE: 0, chess.BLACK: 2},
+    "1/2-1/2": {chess.WHITE: 1, chess.BLACK: 1},
+}
+
+
+def decode_move(raw, position):
+    """
+    Convert a Polyglot move to a Move on the given position. Polyglot writes
+    castling as the king capturing its own rook, e1h1 for e1g1.
+    """
+    end_col, end_rank = raw & 7, raw >> 3 & 7
+    start_col, start_rank = raw >> 6 & 7, raw >> 9 & 7
+    start, end = (7 - start_rank, start_col), (7 - end_rank, end_col)
+    piece = position.board[start[0]][start[1]]
+    target = position.board[end[0]][end[1]]
+    if piece and piece.name == "king" and target and target.name == "rook" and target.color == piece.color:
+        end = (end[0], 6 if end_col > start_col else 2)
+    return Move(start, end, PROMOTION_NAMES.get(raw >> 12 & 7))
+
+
+def encode_move(board, move):
+    """Convert a python-chess move to a Polyglot move, castling as king takes rook"""
+    if board.is_castling(move):
+        rook_file = 7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0
+        move = chess.Move(move.from_square, chess.square(rook_file, chess.square_rank(move.from_square)))
+    return (chess.square_file(move.to_square) | chess.square_rank(move.to_square) << 3
+            | chess.square_file(move.from_square) << 6 | chess.square_rank(move.from_square) << 9
+            | PROMOTION_CODES.get(move.promotion, 0) << 12)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.entry_count = 0
+        self.data = None
+        size = self.file.seek(0, 2)
+        if size >= ENTRY.size:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.entry_count = size // ENTRY.size
+
+    def _first_entry(self, key):
+        """Index of the first entry whose key is not below the given key"""
+        low, high = 0, self.entry_count
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_entries(self, key):
+        """Return the (raw move, weight) pairs stored for a Zobrist key"""
+        entries = []
+        index = self._first_entry(key)
+        while index < self.entry_count:
+            entry_key, raw_move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((raw_move, weight))
+            index += 1
+        return entries
+
+    def get_moves(self, position):
+        """Return the legal book moves of the position with their weights"""
+        legal_moves = position.legal_moves()
+        moves = []
+        for raw_move, weight in self.find_entries(position.key):
+            move = decode_move(raw_move, position)
+            if move in legal_moves:
+                moves.append((move, weight))
+        return moves
+
+    def choose_move(self, position):
+        """Pick a book move at random in proportion to its weight, or None when out of book"""
+        moves = [(move, weight) for move, weight in self.get_moves(position) if weight > 0]
+        if not moves:
+            return None
+        return random.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+class _OpeningVisitor(chess.pgn.BaseVisitor):
+    """Collect the result and the (key, move, side) of the first max_ply moves of a game"""
+
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+
+    def begin_game(self):
+        self.game_result = "*"
+        self.moves = []
+        self.broken = False
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == "Result":
+            self.game_result = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if len(self.moves) < self.max_ply and not self.broken:
+            self.moves.append((chess.polyglot.zobrist_hash(board), encode_move(board, move), board.turn))
+
+    def handle_error(self, error):
+        # Keep the moves before an illegal or unreadable one
+        self.broken = True
+
+    def result(self):
+        return self.game_result, self.moves
+
+
+def _game_boundaries(path, chunk_size):
+    """Split a PGN file into (start, end) byte ranges of whole games"""
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as handle:
+        offset = chunk_size
+        while offset < size:
+            handle.seek(offset)
+            handle.readline()  # Finish the line the offset falls in
+            while True:
+                start = handle.tell()
+                line = handle.readline()
+                if not line or line.startswith(b"[Event "):
+                    break
+            if start >= size:
+                break
+            boundaries.append(start)
+            offset = start + chunk_size
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _write_run(counts, run_dir):
+    """Write move counts to a new run file sorted by key and move, and return its path"""
+    handle, path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(handle, "wb") as run:
+        for (key, move), (score, games) in sorted(counts.items()):
+            run.write(RUN_RECORD.pack(key, move, score, games))
+    return path
+
+
+def _count_chunk(path, start, end, max_ply, run_dir, max_entries):
+    """Replay the games in one chunk of a PGN file, returning the paths of its sorted runs"""
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        text = io.StringIO(handle.read(end - start).decode("utf-8", errors="replace"))
+
+    visitor = _OpeningVisitor(max_ply)
+    counts = {}
+    runs = []
+    while True:
+        game = chess.pgn.read_game(text, Visitor=lambda: visitor)
+        if game is None:
+            break
+        game_result, moves = game
+        scores = RESULT_SCORES.get(game_result)
+        if scores is None:
+            continue
+        for key, move, turn in moves:
+            score, games = counts.get((key, move), (0, 0))
+            counts[key, move] = (score + scores[turn], games + 1)
+        if len(counts) >= max_entries:
+            runs.append(_write_run(counts, run_dir))
+            counts = {}
+    if counts:
+        runs.append(_write_run(counts, run_dir))
+    return runs
+
+
+def _read_run(path, buffer_size=1 << 16):
+    """Yield the records of a run file in order"""
+    with open(path, "rb") as run:
+        while True:
+            data = run.read(buffer_size - buffer_size % RUN_RECORD.size)
+            if not data:
+                break
+            yield from RUN_RECORD.iter_unpack(data)
+
+
+def _sum_runs(runs):
+    """Merge sorted runs, yielding (key, move, score, games) once per move with the counts summed"""
+    records = heapq.merge(*(_read_run(path) for path in runs))
+    for (key, move), group in groupby(records, key=lambda record: record[:2]):
+        score = games = 0
+        for _, _, run_score, run_games in group:
+            score += run_score
+            games += run_games
+        yield key, move, score, games
+
+
+def _merge_runs(runs, run_dir, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted runs like _sum_runs, opening at most fan_in files at once.
+    While there are more runs, each group of fan_in is merged into a new run
+    in run_dir, and the merged runs are deleted.
+    """
+    while len(runs) > fan_in:
+        merged = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            handle, path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+            with os.fdopen(handle, "wb") as run:
+                for record in _sum_runs(group):
+                    run.write(RUN_RECORD.pack(*record))
+            for done in group:
+                os.remove(done)
+            merged.append(path)
+        runs = merged
+    return _sum_runs(runs)
+
+
+def _book_entries(totals, min_games):
+    """Yield (key, move, weight) entries, with each key's weights scaled to 16 bits"""
+    for key, group in groupby(totals, key=lambda total: total[0]):
+        moves = [(move, score) for _, move, score, games in group if games >= min_games and score > 0]
+        if not moves:
+            continue
+        scale = min(1.0, 0xFFFF / max(score for _, score in moves))
+        # Within a key, Polyglot books list the heaviest move first
+        for move, score in sorted(moves, key=lambda entry: entry[1], reverse=True):
+            yield key, move, max(1, int(score * scale))
+
+
+def build_book(pgn_paths, output, max_ply=20, min_games=1, workers=None,
+               chunk_mb=64, max_entries=1000000):
+    """
+    Build a Polyglot book from PGN files. A move scores 2 for each win and 1
+    for each draw of the side that played it; moves seen in fewer than
+    min_games games, or that never scored, are left out.
+    Returns the number of entries written.
+    """
+    chunks = [(path, start, end) for path in pgn_paths
+              for start, end in _game_boundaries(path, int(chunk_mb * 1024 * 1024))]
+    entry_count = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as run_dir:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_count_chunk, path, start, end, max_ply, run_dir, max_entries)
+                       for path, start, end in chunks]
+            runs = [run for future in futures for run in future.result()]
+
+        with open(output, "wb") as book:
+            for key, move, weight in _book_entries(_merge_runs(runs, run_dir), min_games):
+                book.write(ENTRY.pack(key, move, weight, 0))
+                entry_count += 1
+    return entry_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Polyglot opening book tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build-book", help="compile PGN files into a Polyglot .bin book")
+    build.add_argument("pgn", nargs="+", help="PGN files to read")
+    build.add_argument("-o", "--output", default="book.bin", help="book file to write")
+    build.add_argument("--max-ply", type=int, default=20, help="plies of each game to include")
+    build.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    build.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    build.add_argument("--chunk-mb", type=float, default=64, help="size of the PGN chunk each task reads")
+    build.add_argument("--max-entries", type=int, default=1000000,
+                       help="moves a worker counts in memory before writing a sorted run")
+    args = parser.parse_args(argv)
+
+    entry_count = build_book(args.pgn, args.output, args.max_ply, args.min_games,
+                             args.workers, args.chunk_mb, args.max_entries)
+    print(f"Wrote {entry_count} entries to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,116 +1,12 @@
 import tkinter as tk
 from tkinter import messagebox
 import chess
-import chess.engine
-import threading
 import os
 
-
-class ChessEngine:
-    def __init__(self, depth=20):
-        self.depth = depth
-        self.engine = None
-
-        # Get the directory where the script is located
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-
-        # Use the exact executable name
-        self.engine_path = os.path.join(current_dir, "stockfish",
-                                        "stockfish-windows-x86-64-sse41-popcnt.exe")
-
-        self.initialize_engine()
-
-    def configure_engine(self):
-        """Configure the chess engine based on difficulty settings"""
-        try:
-            # Adjusted ELO ratings to work with Stockfish's limits (1320-3190)
-            difficulty_settings = {
-                "easy": {"skill": 0, "elo": 1320},  # Minimum allowed ELO
-                "medium": {"skill": 5, "elo": 1500},
-                "hard": {"skill": 10, "elo": 1800},
-                "master": {"skill": 15, "elo": 2200},
-                "grandmaster": {"skill": 20, "elo": 2500},
-                "stockfish": {"skill": 20, "elo": 3190}  # Maximum allowed ELO
-            }
-
-            settings = difficulty_settings.get(self.difficulty, difficulty_settings["medium"])
-
-            # Configure engine with supported options
-            config = {
-                "Skill Level": settings["skill"],
-                "UCI_LimitStrength": True,
-                "UCI_Elo": settings["elo"]
-            }
-
-            self.engine.engine.configure(config)
-            print(f"Engine configured for {self.difficulty} mode with ELO {settings['elo']}")
-        except Exception as e:
-            print(f"Error configuring engine: {e}")
-    def initialize_engine(self):
-        try:
-            if not os.path.exists(self.engine_path):
-                raise FileNotFoundError(
-                    f"Stockfish engine not found at: {self.engine_path}\n"
-                    f"Current directory: {os.path.dirname(os.path.abspath(__file__))}"
-                )
-
-            print(f"Attempting to initialize engine at: {self.engine_path}")
-            self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
-            print("Chess engine initialized successfully")
-
-        except Exception as e:
-            print(f"Error initializing engine: {e}")
-            messagebox.showerror("Engine Error",
-                                 f"Could not initialize chess engine.\nError: {str(e)}")
-            self.engine = None
-
-    def get_best_move(self, board_fen, time_limit=None):
-        if not self.engine:
-            return None
-
-        try:
-            board = chess.Board(board_fen)
-            # Use the specified time limit or default based on difficulty
-            if time_limit is None:
-                time_limit = 1.0  # Default to 1 second
-
-            result = self.engine.play(
-                board,
-                chess.engine.Limit(time=time_limit)
-            )
-            return result.move
-        except Exception as e:
-            print(f"Error getting best move: {e}")
-            return None
-
-    def get_position_evaluation(self, board_fen):
-        if not self.engine:
-            return None
-
-        try:
-            board = chess.Board(board_fen)
-            info = self.engine.analyse(board, chess.engine.Limit(depth=self.depth))
-            score = info["score"].relative.score()
-            return score / 100  # Convert centipawns to pawns
-        except Exception as e:
-            print(f"Error getting evaluation: {e}")
-            return None
-
-    def close(self):
-        """Safely close the engine"""
-        if self.engine:
-            try:
-                self.engine.quit()
-            except Exception as e:
-                print(f"Warning: Error quitting engine: {e}")
-            finally:
-                self.engine = None
-class ChessPiece:
-    def __init__(self, color, name):
-        self.color = color
-        self.name = name
-        self.has_moved = False
-        self.en_passant_vulnerable = False
+from chess_book import OpeningBook
+from chess_rules import Position, parse_uci
+from chess_tablebase import Tablebase
+from chess_uci import ChessEngine
 
 
 class ChessGame:
@@ -124,21 +20,32 @@ class ChessGame:
         # Game mode settings
         self.player_color = "white" if game_mode == "single_player" else None
         self.engine_thinking = False
-
-
+        self.engine_request = None  # Future of the engine move being searched
+        # Streaming analysis for the evaluation bar, on its own engine so it
+        # never interrupts the engine's moves
+        self.analysis_enabled = False
+        self.analyser = None
+        self.analysis = None  # Future of the analysis being streamed
+        self.tablebase_request = None  # Future of the tablebase probe of the evaluation bar
+        self.evaluation = 0.0  # Score shown on the evaluation bar, in pawns for white
+
+
+        # skill and elo limit a UCI engine; the built-in search is limited
+        # by depth (None for no limit) and time per move instead
         self.difficulty_settings = {
-            "beginner": {"skill": 0, "elo": 1320, "time": 0.1},
-            "intermediate": {"skill": 5, "elo": 1500, "time": 0.2},
-            "advanced": {"skill": 10, "elo": 1800, "time": 0.3},
-            "expert": {"skill": 15, "elo": 2200, "time": 0.5},
-            "master": {"skill": 18, "elo": 2500, "time": 0.7},
-            "grandmaster": {"skill": 20, "elo": 3000, "time": 1.0}
+            "beginner": {"skill": 0, "elo": 1320, "depth": 1, "time": 0.1},
+            "intermediate": {"skill": 5, "elo": 1500, "depth": 2, "time": 0.2},
+            "advanced": {"skill": 10, "elo": 1800, "depth": 3, "time": 0.3},
+            "expert": {"skill": 15, "elo": 2200, "depth": 4, "time": 0.5},
+            "master": {"skill": 18, "elo": 2500, "depth": 6, "time": 0.7},
+            "grandmaster": {"skill": 20, "elo": 3000, "depth": None, "time": 1.0}
         }
 
-        # Initialize game state variables
-        self.move_history = []
-        self.halfmove_clock = 0
-        self.position_counts = {}
+        # Game state lives in a headless Position; this class is a view over it
+        self.position = Position.starting_position()
+        # The same game as a chess.Board for the engines, which receive it as
+        # "position startpos moves ..." and keep their hash from move to move
+        self.engine_board = chess.Board()
 
         # Main container
         self.main_container = tk.Frame(self.root, bg='#2C3E50')
@@ -176,6 +83,36 @@ class ChessGame:
         )
         self.draw_button.pack(side=tk.LEFT, padx=10)
 
+        # Undo button
+        self.undo_button = tk.Button(
+            self.control_panel,
+            text="Undo",
+            command=self.undo_move,
+            font=('Helvetica', 12),
+            bg='#34495E',
+            fg='white',
+            activebackground='#2C3E50',
+            activeforeground='white',
+            bd=0,
+            cursor='hand2'
+        )
+        self.undo_button.pack(side=tk.LEFT, padx=10)
+
+        # Analysis toggle
+        self.analysis_button = tk.Button(
+            self.control_panel,
+            text="Analysis: Off",
+            command=self.toggle_analysis,
+            font=('Helvetica', 12),
+            bg='#34495E',
+            fg='white',
+            activebackground='#2C3E50',
+            activeforeground='white',
+            bd=0,
+            cursor='hand2'
+        )
+        self.analysis_button.pack(side=tk.LEFT, padx=10)
+
         # Turn indicator
         self.turn_label = tk.Label(self.control_panel,
                                    text="White's turn",
@@ -233,14 +170,35 @@ class ChessGame:
         )
         self.white_material_label.pack(pady=10)
 
+        # Depth and best line of the engine analysis, when it is on
+        self.analysis_label = tk.Label(
+            self.eval_frame,
+            text="",
+            font=("Helvetica", 10),
+            bg='#2C3E50',
+            fg='#BDC3C7',
+            justify=tk.LEFT
+        )
+        self.analysis_label.pack(pady=5)
+
         # Chess board container
         self.board_container = tk.Frame(self.game_area, bg='#2C3E50')
         self.board_container.pack(side=tk.LEFT, expand=True, fill='both')
 
-        # Initialize the engine
-        self.engine = ChessEngine()
-        if game_mode == "single_player" and self.engine.engine:
+        # Polyglot opening book and Syzygy tablebases, if installed next to the game
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        book_path = os.path.join(current_dir, "book.bin")
+        self.book = OpeningBook(book_path) if os.path.exists(book_path) else None
+        tablebase_dir = os.path.join(current_dir, "syzygy")
+        self.tablebase = Tablebase(tablebase_dir) if os.path.isdir(tablebase_dir) else None
+
+        # The engine starts lazily in the background; single-player games will
+        # need it, so start it now, while two-player games wait for a hint request.
+        # It answers endgames the tablebase covers without searching.
+        self.engine = ChessEngine(ponder=game_mode == "single_player", tablebase=self.tablebase)
+        if game_mode == "single_player":
             self.configure_engine()
+            self.engine.start()
 
         # Add engine controls only for two-player mode
         if game_mode == "two_player":
@@ -248,8 +206,6 @@ class ChessGame:
 
         # Initialize game components
         self.selected_piece = None
-        self.current_player = "white"
-        self.last_move = None
         self.board_size = 8
         self.cell_size = 80
         self.canvas_size = self.board_size * self.cell_size
@@ -271,9 +227,9 @@ class ChessGame:
         )
         self.canvas.pack(padx=20, pady=20)
         self.canvas.bind('<Button-1>', self.on_square_click)
-        # Initialize the board
-        self.board = [[None for _ in range(self.board_size)] for _ in range(self.board_size)]
-        self.create_pieces()
+        self.create_board_items()
+        # Draw the initial position
+        self.update_evaluation_display()
         self.draw_board()
 
         # Bind click event
@@ -283,6 +239,14 @@ class ChessGame:
         if game_mode == "single_player" and self.player_color == "white":
             self.root.after(1000, self.make_computer_move)
 
+    @property
+    def board(self):
+        return self.position.board
+
+    @property
+    def current_player(self):
+        return self.position.current_player
+
     def initialize_ui(self):
         # Main container
         self.main_container = tk.Frame(self.root, bg='#2C3E50')
@@ -308,7 +272,8 @@ class ChessGame:
                 "UCI_Elo": settings["elo"]
             }
 
-            self.engine.engine.configure(config)
+            self.engine.configure(config)
+            self.engine.limit_fallback(settings["depth"], settings["time"])
             print(f"Engine configured for {self.difficulty} mode with ELO {settings['elo']}")
         except Exception as e:
             print(f"Error configuring engine: {e}")
@@ -319,55 +284,42 @@ class ChessGame:
             return
 
         if self.current_player != self.player_color:
-            self.engine_thinking = True
-
-            def engine_think():
-                try:
-                    # Get current position FEN
-                    fen = self.board_to_fen()
-
-                    # Get engine's move
-                    move = self.engine.get_best_move(fen)
-
-                    if move:
-                        # Convert move to board coordinates
-                        start_square = chess.square_name(move.from_square)
-                        end_square = chess.square_name(move.to_square)
-
-                        # Convert algebraic notation to board coordinates
-                        start_col = ord(start_square[0]) - ord('a')
-                        start_row = 8 - int(start_square[1])
-                        end_col = ord(end_square[0]) - ord('a')
-                        end_row = 8 - int(end_square[1])
-
-                        # Make the move on the main thread
-                        self.root.after(0, lambda: self.make_move(
-                            (start_row, start_col), (end_row, end_col)))
-
-                except Exception as e:
-                    print(f"Error in computer move: {e}")
-                finally:
-                    self.engine_thinking = False
+            # Off the pondered line the ponder search is useless, even if no search follows
+            if not self.engine.is_ponder_hit(self.engine_board):
+                self.engine.stop_pondering()
+
+            # Play straight from the opening book when it knows the position
+            book_move = self.get_book_move()
+            if book_move:
+                self.make_move(book_move.start, book_move.end, book_move.promotion)
+                return
 
-            # Run engine analysis in separate thread
-            threading.Thread(target=engine_think, daemon=True).start()
+            self.request_engine_move(self.make_move)
 
-    def make_move(self, start, end):
+    def make_move(self, start, end, promotion=None):
         """Execute a move and handle the aftermath"""
-        if self.is_valid_move(start, end):
-            self.move_piece(start, end)
+        if self.position.is_valid_move(start, end):
+            # Ask which piece to promote to before playing the move
+            piece = self.board[start[0]][start[1]]
+            if promotion is None and piece.name == "pawn" and end[0] in (0, 7):
+                self.promote_pawn(start, end)
+                return
 
-            # Switch turns
-            opposite_color = "black" if self.current_player == "white" else "white"
-            if self.is_checkmate(opposite_color):
-                self.game_over(self.current_player)
-            else:
-                self.current_player = opposite_color
+            mover = self.current_player
+            self.move_piece(start, end, promotion)
+
+            # The position has already passed the turn to the opponent; its legal
+            # moves are generated once here and reused for highlights and clicks
+            if self.position.is_checkmate(self.current_player):
+                self.game_over(mover)
+            elif not self.is_draw():
                 self.turn_label.config(text=f"{self.current_player.capitalize()}'s turn")
 
-                # If in single player mode and it's computer's turn, make computer move
+                # If in single player mode and it's computer's turn, make computer move;
+                # a ponder hit is answered at once, so there is no pause before it
                 if self.game_mode == "single_player" and self.current_player != self.player_color:
-                    self.root.after(500, self.make_computer_move)
+                    delay = 0 if self.engine.is_ponder_hit(self.engine_board) else 500
+                    self.root.after(delay, self.make_computer_move)
 
             self.selected_piece = None
             self.draw_board()
@@ -413,7 +365,7 @@ class ChessGame:
                 return
 
             # Attempt to move the piece
-            if self.is_valid_move(self.selected_piece, (row, col)):
+            if self.position.is_valid_move(self.selected_piece, (row, col)):
                 self.make_move(self.selected_piece, (row, col))
             else:
                 # Invalid move, just deselect the piece
@@ -437,20 +389,6 @@ class ChessGame:
             color = piece_name.split('_')[0]
             self.piece_images[piece_name] = symbol
 
-    def create_pieces(self):
-        # Add pawns - switched positions
-        for col in range(self.board_size):
-            self.board[1][col] = ChessPiece("black", "pawn")  # Changed to black
-            self.board[6][col] = ChessPiece("white", "pawn")  # Changed to white
-
-        # Add other pieces - switched colors
-        piece_order = ["rook", "knight", "bishop", "queen", "king", "bishop", "knight", "rook"]
-        for col, piece_name in enumerate(piece_order):
-            self.board[0][col] = ChessPiece("black", piece_name)  # Changed to black
-            self.board[7][col] = ChessPiece("white", piece_name)  # Changed to white
-        # Update evaluation after creating pieces
-        self.update_evaluation_display()
-
     def configure_engine_difficulty(self):
         # Initialize engine with appropriate settings
         skill_levels = {
@@ -465,12 +403,13 @@ class ChessGame:
         settings = skill_levels.get(self.difficulty, skill_levels["medium"])
 
         try:
-            if self.engine and self.engine.engine:
-                self.engine.engine.configure({
+            if self.engine:
+                self.engine.configure({
                     "Skill Level": settings["skill"],
                     "Minimum Thinking Time": int(settings["time"] * 1000),  # Convert to milliseconds
                     "Slow Mover": 100,  # Normal speed
                 })
+                self.engine.limit_fallback(settings["depth"], settings["time"])
                 print(f"Engine configured for {self.difficulty} mode")
         except Exception as e:
             print(f"Error configuring engine: {e}")
@@ -492,82 +431,73 @@ class ChessGame:
             )
             self.engine_button.pack(side=tk.LEFT, padx=10)
 
-    def board_to_fen(self):
-        """Convert current board position to FEN string"""
-        fen = []
-        for row in range(self.board_size):
-            empty = 0
-            row_fen = ''
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece is None:
-                    empty += 1
-                else:
-                    if empty > 0:
-                        row_fen += str(empty)
-                        empty = 0
-                    # Convert piece to FEN notation
-                    symbol = piece.name[0].upper() if piece.name != 'knight' else 'N'
-                    if piece.color == 'black':
-                        symbol = symbol.lower()
-                    row_fen += symbol
-            if empty > 0:
-                row_fen += str(empty)
-            fen.append(row_fen)
-
-        # Join rows and add other FEN components
-        fen_str = '/'.join(fen)
-        fen_str += f" {'w' if self.current_player == 'white' else 'b'} KQkq - 0 1"
-        return fen_str
+    def get_book_move(self):
+        """A move from the opening book, or None if the engine must answer"""
+        if self.book:
+            return self.book.choose_move(self.position)
+        return None
 
     def get_engine_move(self):
         if self.engine_thinking:
             return
 
-        self.engine_thinking = True
-        self.engine_button.config(state='disabled')
-
-        def engine_think():
-            try:
-                # Get current position FEN
-                fen = self.board_to_fen()
+        book_move = self.get_book_move()
+        if book_move:
+            self.make_engine_move(book_move.start, book_move.end, book_move.promotion)
+            return
 
-                # Get engine's move
-                move = self.engine.get_best_move(fen)
+        self.engine_button.config(state='disabled')
+        self.request_engine_move(self.make_engine_move)
 
-                if move:
-                    # Convert move to board coordinates
-                    start_square = chess.square_name(move.from_square)
-                    end_square = chess.square_name(move.to_square)
+    def request_engine_move(self, on_move):
+        """
+        Ask the engine for a move in the background. on_move(start, end,
+        promotion) is called on the Tk thread, unless the request has been
+        cancelled in the meantime.
+        """
+        request = self.engine.play(self.engine_board)
+        self.engine_request = request
+        self.engine_thinking = True
 
-                    # Convert algebraic notation to board coordinates
-                    start_col = ord(start_square[0]) - ord('a')
-                    start_row = 8 - int(start_square[1])
-                    end_col = ord(end_square[0]) - ord('a')
-                    end_row = 8 - int(end_square[1])
+        def deliver():
+            if request is not self.engine_request:
+                return  # Cancelled by a new game or undo
+            self.finish_engine_request()
+            try:
+                move = request.result()
+            except Exception as e:
+                print(f"Error getting engine move: {e}")
+                return
+            if move:
+                start, end, promotion = parse_uci(move.uci())
+                on_move(start, end, promotion)
 
-                    # Make the move
-                    self.root.after(0, lambda: self.make_engine_move(
-                        (start_row, start_col), (end_row, end_col)))
+        # The result arrives on the engine loop thread; hand it to the Tk thread
+        request.add_done_callback(lambda _: self.root.after(0, deliver))
 
-            finally:
-                self.engine_thinking = False
-                self.root.after(0, lambda: self.engine_button.config(state='normal'))
+    def finish_engine_request(self):
+        self.engine_request = None
+        self.engine_thinking = False
+        if self.game_mode == "two_player":
+            self.engine_button.config(state='normal')
 
-        # Run engine analysis in separate thread
-        threading.Thread(target=engine_think, daemon=True).start()
+    def cancel_engine_request(self):
+        """Stop the engine search in progress; its move is never played"""
+        request = self.engine_request
+        if request is not None:
+            self.finish_engine_request()
+            request.cancel()
 
-    def make_engine_move(self, start, end):
+    def make_engine_move(self, start, end, promotion=None):
         """Execute the engine's move"""
-        if self.is_valid_move(start, end):
-            self.move_piece(start, end)
-
-            # Switch turns
-            opposite_color = "black" if self.current_player == "white" else "white"
-            if self.is_checkmate(opposite_color):
-                self.game_over(self.current_player)
-            else:
-                self.current_player = opposite_color
+        if self.position.is_valid_move(start, end):
+            mover = self.current_player
+            self.move_piece(start, end, promotion or "queen")
+
+            # The position has already passed the turn to the opponent
+            if self.position.is_checkmate(self.current_player):
+                self.game_over(mover)
+            elif not self.is_draw():
                 self.turn_label.config(text=f"{self.current_player.capitalize()}'s turn")
 
             self.selected_piece = None
@@ -584,100 +514,41 @@ class ChessGame:
 
     def cleanup(self):
         """Properly clean up resources before destroying the game"""
+        if getattr(self, 'engine_request', None):
+            self.cancel_engine_request()
+        if getattr(self, 'analyser', None):
+            self.stop_analysis()
+            self.analyser.close()
+            self.analyser = None
         if hasattr(self, 'engine') and self.engine:
             try:
                 self.engine.close()
                 self.engine = None
             except Exception as e:
                 print(f"Warning: Error closing engine: {e}")
+        if getattr(self, 'book', None):
+            self.book.close()
+            self.book = None
+        if getattr(self, 'tablebase', None):
+            self.tablebase.close()
+            self.tablebase = None
 
     def is_draw(self):
-        """Check all draw conditions"""
-        if self.is_stalemate(self.current_player):
+        """
+        Check the draws that end the game by themselves. Threefold repetition
+        and the fifty-move rule have to be claimed with the draw button.
+        """
+        if self.position.is_stalemate(self.current_player):
             self.draw_game("Stalemate")
             return True
-        if self.is_insufficient_material():
-            self.draw_game("Insufficient Material")
-            return True
-        if self.is_threefold_repetition():
-            self.draw_game("Threefold Repetition")
-            return True
-        if self.is_fifty_move_rule():
-            self.draw_game("Fifty-Move Rule")
-            return True
-        if self.is_dead_position():
+        if self.position.is_dead_position():
             self.draw_game("Dead Position")
             return True
         return False
 
-    def is_insufficient_material(self):
-        """Check if there's insufficient material for checkmate"""
-        pieces = {'white': [], 'black': []}
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece:
-                    pieces[piece.color].append(piece.name)
-
-        # Remove kings from the count
-        for color in pieces:
-            pieces[color].remove('king')
-
-        # Check insufficient material conditions
-        for color in pieces:
-            if not pieces[color]:  # Only king
-                continue
-            if len(pieces[color]) == 1:
-                if pieces[color][0] in ['bishop', 'knight']:  # King and bishop/knight
-                    continue
-            return False
-        return True
-
-    def is_threefold_repetition(self):
-        """Check if the current position has occurred three times"""
-        position = self.get_position_string()
-        self.position_counts[position] = self.position_counts.get(position, 0) + 1
-        return self.position_counts[position] >= 3
-
-    def is_fifty_move_rule(self):
-        """Check if fifty moves have been made without pawn movement or capture"""
-        return self.halfmove_clock >= 100  # 50 moves = 100 halfmoves
-
-    def is_dead_position(self):
-        """Check if the position is dead (impossible to checkmate)"""
-        pieces = {'white': [], 'black': []}
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece:
-                    pieces[piece.color].append(piece.name)
-
-        # King vs King
-        if len(pieces['white']) == 1 and len(pieces['black']) == 1:
-            return True
-
-        # King and bishop/knight vs King
-        for color in ['white', 'black']:
-            other = 'black' if color == 'white' else 'white'
-            if len(pieces[color]) == 2 and len(pieces[other]) == 1:
-                if 'bishop' in pieces[color] or 'knight' in pieces[color]:
-                    return True
-
-        return False
-
-    def get_position_string(self):
-        """Convert current board position to a string for comparison"""
-        position = ""
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece:
-                    position += f"{piece.color}_{piece.name}_{row}_{col}_"
-        position += f"{self.current_player}"
-        return position
-
     def draw_game(self, reason):
         """Handle the draw game window"""
+        self.engine.stop_pondering()
         draw_window = tk.Toplevel(self.root)
         draw_window.title("Game Draw")
         draw_window.geometry("300x200")
@@ -698,11 +569,9 @@ class ChessGame:
             draw_window.destroy()
             self.reset_game()
 
-        def return_to_menu(self):
-            """Return to the main menu"""
-            self.cleanup()  # Clean up resources first
-            self.root.destroy()  # Close game window
-            self.main_menu.root.deiconify()  # Show main menu
+        def return_to_menu():
+            draw_window.destroy()
+            self.return_to_menu()
 
         # Add buttons
         tk.Button(draw_window,
@@ -719,10 +588,14 @@ class ChessGame:
         self.canvas.unbind('<Button-1>')
 
     def offer_draw(self):
-        """Handle draw offers"""
-        if self.game_mode == "single_player":
-            # For single player, make the computer's decision based on evaluation
-            eval_score = self.evaluate_position()
+        """Handle draw offers, granting repetition and fifty-move claims"""
+        if self.position.is_threefold_repetition():
+            self.draw_game("Threefold Repetition")
+        elif self.position.is_fifty_move_rule():
+            self.draw_game("Fifty-Move Rule")
+        elif self.game_mode == "single_player":
+            # For single player, make the computer's decision based on the evaluation shown
+            eval_score = self.evaluation
             computer_accepts = abs(eval_score) < 0.5  # Accept if position is roughly equal
 
             if computer_accepts:
@@ -739,246 +612,119 @@ class ChessGame:
             if response:
                 self.draw_game("Draw by Agreement")
 
-    def is_checkmate(self, color):
-        """
-        Check if the specified color is in checkmate
-        """
-        # If not in check, it's not checkmate
-        if not self.is_in_check(color):
-            return False
-
-        # If in check, see if there are any valid moves that can get out of check
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for end_row in range(self.board_size):
-                        for end_col in range(self.board_size):
-                            if self.is_valid_move((row, col), (end_row, end_col)):
-                                return False
-        return True
-
     def return_to_menu(self):
         self.root.destroy()  # Close game window
         self.main_menu.root.deiconify()  # Show main menu
 
-    def get_valid_moves(self, start):
+    def create_board_items(self):
         """
-        Get all valid moves for a piece at the given position
+        Create every canvas item of the board once: a square and a piece per
+        cell, then the move markers and the check outline above them, hidden.
+        draw_board only reconfigures the items whose state has changed.
         """
-        if not start:
-            return []
-
-        start_row, start_col = start
-        piece = self.board[start_row][start_col]
-        if not piece:
-            return []
-
-        valid_moves = []
+        self.square_items = []
+        self.piece_items = []
+        for row in range(self.board_size):
+            square_row, piece_row = [], []
+            for col in range(self.board_size):
+                x1 = col * self.cell_size
+                y1 = row * self.cell_size
+                square_row.append(self.canvas.create_rectangle(
+                    x1, y1, x1 + self.cell_size, y1 + self.cell_size, outline="", tags="square"))
+                piece_row.append(self.canvas.create_text(
+                    x1 + self.cell_size // 2, y1 + self.cell_size // 2,
+                    text="", font=("Arial", 36), tags="piece"))
+            self.square_items.append(square_row)
+            self.piece_items.append(piece_row)
+
+        # Move indicators: a green dot for a move, a red circle for a capture
+        self.move_dots = []
+        self.capture_rings = []
         for row in range(self.board_size):
+            dot_row, ring_row = [], []
             for col in range(self.board_size):
-                if self.is_valid_move((start_row, start_col), (row, col)):
-                    valid_moves.append((row, col))
-        return valid_moves
+                x = col * self.cell_size + self.cell_size // 2
+                y = row * self.cell_size + self.cell_size // 2
+                dot_row.append(self.canvas.create_oval(
+                    x - 5, y - 5, x + 5, y + 5,
+                    fill="green", outline="darkgreen", state="hidden", tags="move_dot"))
+                ring_row.append(self.canvas.create_oval(
+                    x - self.cell_size // 3, y - self.cell_size // 3,
+                    x + self.cell_size // 3, y + self.cell_size // 3,
+                    outline="red", width=2, state="hidden", tags="capture_ring"))
+            self.move_dots.append(dot_row)
+            self.capture_rings.append(ring_row)
+
+        self.check_item = self.canvas.create_rectangle(
+            0, 0, self.cell_size, self.cell_size, outline="red", width=3, state="hidden", tags="check")
+
+        # What each item currently shows, so that draw_board can skip unchanged ones
+        self.drawn_squares = [[None] * self.board_size for _ in range(self.board_size)]
+        self.drawn_markers = set()
+        self.drawn_check = None
 
     def draw_board(self):
-        self.canvas.delete("all")
-
-        # Draw squares
+        """Bring the canvas items up to date with the position and the selection"""
         for row in range(self.board_size):
             for col in range(self.board_size):
-                x1 = col * self.cell_size
-                y1 = row * self.cell_size
-                x2 = x1 + self.cell_size
-                y2 = y1 + self.cell_size
-
                 # Alternate colors for squares
                 fill = "#DDB88C" if (row + col) % 2 == 0 else "#A66D4F"
 
                 # Highlight selected piece's square
-                if (self.selected_piece and
-                        self.selected_piece[0] == row and
-                        self.selected_piece[1] == col):
+                if self.selected_piece == (row, col):
                     fill = "#AAD794"  # Highlight color
 
-                self.canvas.create_rectangle(x1, y1, x2, y2, fill=fill, outline="")
-
-                # Draw piece if present
                 piece = self.board[row][col]
-                if piece:
-                    piece_key = f"{piece.color}_{piece.name}"
-                    self.canvas.create_text(
-                        (x1 + x2) // 2,
-                        (y1 + y2) // 2,
-                        text=self.piece_images[piece_key],
-                        font=("Arial", 36),
-                        fill="white" if piece.color == "white" else "black"
-                    )
-
-        # Draw move indicators
-        if self.selected_piece:
-            valid_moves = self.get_valid_moves(self.selected_piece)
-            for move in valid_moves:
-                row, col = move
-                x = col * self.cell_size + self.cell_size // 2
-                y = row * self.cell_size + self.cell_size // 2
+                state = (fill, piece.color, piece.name) if piece else (fill, None, None)
+                drawn = self.drawn_squares[row][col]
+                if state == drawn:
+                    continue
+                if drawn is None or drawn[0] != fill:
+                    self.canvas.itemconfig(self.square_items[row][col], fill=fill)
+                if drawn is None or drawn[1:] != state[1:]:
+                    if piece:
+                        self.canvas.itemconfig(self.piece_items[row][col],
+                                               text=self.piece_images[f"{piece.color}_{piece.name}"],
+                                               fill="white" if piece.color == "white" else "black")
+                    else:
+                        self.canvas.itemconfig(self.piece_items[row][col], text="")
+                self.drawn_squares[row][col] = state
 
-                # Draw different indicators based on the type of move
-                target_piece = self.board[row][col]
-                if target_piece:
-                    # Draw capture indicator (red circle)
-                    self.canvas.create_oval(
-                        x - self.cell_size // 3, y - self.cell_size // 3,
-                        x + self.cell_size // 3, y + self.cell_size // 3,
-                        outline="red", width=2
-                    )
-                else:
-                    # Draw move indicator (green dot)
-                    self.canvas.create_oval(
-                        x - 5, y - 5, x + 5, y + 5,
-                        fill="green", outline="darkgreen"
-                    )
+        # Move indicators for the selected piece
+        markers = set()
+        if self.selected_piece:
+            for row, col in self.position.get_valid_moves(self.selected_piece):
+                markers.add((row, col, self.board[row][col] is not None))
+        for row, col, capture in self.drawn_markers - markers:
+            item = self.capture_rings[row][col] if capture else self.move_dots[row][col]
+            self.canvas.itemconfig(item, state="hidden")
+        for row, col, capture in markers - self.drawn_markers:
+            item = self.capture_rings[row][col] if capture else self.move_dots[row][col]
+            self.canvas.itemconfig(item, state="normal")
+        self.drawn_markers = markers
 
         # Highlight king if in check
-        king_pos = self.find_king(self.current_player)
-        if king_pos and self.is_in_check(self.current_player):
-            row, col = king_pos
-            x1 = col * self.cell_size
-            y1 = row * self.cell_size
-            x2 = x1 + self.cell_size
-            y2 = y1 + self.cell_size
-            self.canvas.create_rectangle(x1, y1, x2, y2, outline="red", width=3)
-
-    def is_valid_castling(self, start, end):
-        start_row, start_col = start
-        end_row, end_col = end
-        king = self.board[start_row][start_col]
-
-        # Basic checks
-        if king.has_moved or self.is_in_check(king.color):
-            return False
-
-        # Determine rook position and target squares
-        if end_col > start_col:  # Kingside castling
-            rook_col = 7
-            path_cols = [5, 6]  # Squares that must be empty and safe
-            through_squares = [(start_row, 5), (start_row, 6)]  # Squares the king moves through
-        else:  # Queenside castling
-            rook_col = 0
-            path_cols = [1, 2, 3]  # Squares that must be empty and safe
-            through_squares = [(start_row, 2), (start_row, 3)]  # Squares the king moves through
-
-        # Check if rook is in position and hasn't moved
-        rook = self.board[start_row][rook_col]
-        if not rook or rook.name != "rook" or rook.has_moved:
-            return False
-
-        # Check if squares between king and rook are empty
-        for col in path_cols:
-            if self.board[start_row][col] is not None:
-                return False
-
-        # Check if the king moves through or ends up on any square that is under attack
-        for square in through_squares:
-            # Temporarily move king to check if square is safe
-            original_king = self.board[start_row][start_col]
-            self.board[start_row][start_col] = None
-            self.board[square[0]][square[1]] = king
-
-            # Check if this square is under attack
-            square_under_attack = False
-            for r in range(self.board_size):
-                for c in range(self.board_size):
-                    piece = self.board[r][c]
-                    if piece and piece.color != king.color:
-                        if self.is_valid_basic_move((r, c), square):
-                            square_under_attack = True
-                            break
-                if square_under_attack:
-                    break
-
-            # Move king back
-            self.board[start_row][start_col] = original_king
-            self.board[square[0]][square[1]] = None
-
-            if square_under_attack:
-                return False
-
-        return True
-
-    def move_puts_in_check(self, start, end):
-        """
-        Check if making this move would put or leave the player's king in check
-        """
-        start_row, start_col = start
-        end_row, end_col = end
-
-        # Store the current board state
-        piece = self.board[start_row][start_col]
-        target = self.board[end_row][end_col]
-
-        # Temporarily make the move
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = None
-
-        # Check if the king is in check after the move
-        in_check = self.is_in_check(piece.color)
-
-        # Undo the move
-        self.board[start_row][start_col] = piece
-        self.board[end_row][end_col] = target
-
-        return in_check
-
-    def move_piece(self, start, end):
-        start_row, start_col = start
-        end_row, end_col = end
-        piece = self.board[start_row][start_col]
-
-        # Store last move
-        self.last_move = (start, end)
+        check = None
+        if self.position.is_in_check(self.current_player):
+            check = self.position.find_king(self.current_player)
+        if check != self.drawn_check:
+            if check:
+                row, col = check
+                x1 = col * self.cell_size
+                y1 = row * self.cell_size
+                self.canvas.coords(self.check_item, x1, y1, x1 + self.cell_size, y1 + self.cell_size)
+                self.canvas.itemconfig(self.check_item, state="normal")
+            else:
+                self.canvas.itemconfig(self.check_item, state="hidden")
+            self.drawn_check = check
 
-        # Reset en passant vulnerability for all pawns
-        for row in self.board:
-            for p in row:
-                if p and p.name == "pawn":
-                    p.en_passant_vulnerable = False
-
-        # Handle castling
-        if piece.name == "king" and abs(end_col - start_col) == 2:
-            # Move rook
-            if end_col > start_col:  # Kingside castling
-                rook = self.board[start_row][7]
-                self.board[start_row][5] = rook  # Move rook to F1/F8
-                self.board[start_row][7] = None
-            else:  # Queenside castling
-                rook = self.board[start_row][0]
-                self.board[start_row][3] = rook  # Move rook to D1/D8
-                self.board[start_row][0] = None
-            if rook:
-                rook.has_moved = True
-
-        # Handle en passant capture
-        if piece.name == "pawn" and abs(start_col - end_col) == 1 and not self.board[end_row][end_col]:
-            self.board[start_row][end_col] = None
-
-        # Set en passant vulnerability for two-square pawn moves
-        if piece.name == "pawn" and abs(start_row - end_row) == 2:
-            piece.en_passant_vulnerable = True
-
-        # Move piece
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = None
-        piece.has_moved = True
-
-        # Check for pawn promotion
-        if piece.name == "pawn":
-            if (piece.color == "white" and end_row == 0) or \
-                    (piece.color == "black" and end_row == 7):
-                self.promote_pawn(end_row, end_col)
-
-        # Update evaluation immediately after the move
-        self.update_evaluation_display()
+    def move_piece(self, start, end, promotion="queen"):
+        """Play a validated move on the position and its engine mirror"""
+        piece = self.board[start[0]][start[1]]
+        promotes = piece.name == "pawn" and end[0] in (0, 7)
+        self.position.move_piece(start, end, promotion)
+        self.engine_board.push(chess.Move(chess.square(start[1], 7 - start[0]), chess.square(end[1], 7 - end[0]),
+                                          chess.PIECE_NAMES.index(promotion) if promotes else None))
 
     def add_draw_button(self):
         """Add draw offer button to control panel"""
@@ -997,191 +743,8 @@ class ChessGame:
         self.draw_button.pack(side=tk.LEFT, padx=10)
 
 
-    def is_stalemate(self, color):
-        if self.is_in_check(color):
-            return False
-        return not self.has_valid_moves(color)
-
-    def has_valid_moves(self, color):
-        """
-        Check if the specified color has any valid moves
-        """
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for r in range(self.board_size):
-                        for c in range(self.board_size):
-                            if self.is_valid_move((row, col), (r, c)):
-                                return True
-        return False
-
-    def is_valid_basic_move(self, start, end):
-        start_row, start_col = start
-        end_row, end_col = end
-
-        # Basic boundary checks
-        if not (0 <= start_row < 8 and 0 <= start_col < 8 and 0 <= end_row < 8 and 0 <= end_col < 8):
-            return False
-
-        piece = self.board[start_row][start_col]
-        target = self.board[end_row][end_col]
-
-        # Must have a piece to move
-        if not piece:
-            return False
-
-        # Can't capture own pieces
-        if target and target.color == piece.color:
-            return False
-
-        # Calculate move deltas
-        row_diff = end_row - start_row
-        col_diff = end_col - start_col
-
-        # Check piece-specific movement rules
-        if piece.name == "pawn":
-            if piece.color == "white":
-                # Normal move forward
-                if col_diff == 0 and not target:
-                    if row_diff == -1:
-                        return True
-                    # First move can be two squares
-                    if not piece.has_moved and row_diff == -2:
-                        return not self.board[start_row - 1][start_col]  # Path must be clear
-
-                # Capture moves (including en passant)
-                if row_diff == -1 and abs(col_diff) == 1:
-                    # Normal capture
-                    if target:
-                        return True
-                    # En passant
-                    if (self.last_move and
-                            self.board[start_row][end_col] and
-                            self.board[start_row][end_col].name == "pawn" and
-                            self.board[start_row][end_col].en_passant_vulnerable):
-                        return True
-
-            else:  # Black pawn
-                # Normal move forward
-                if col_diff == 0 and not target:
-                    if row_diff == 1:
-                        return True
-                    # First move can be two squares
-                    if not piece.has_moved and row_diff == 2:
-                        return not self.board[start_row + 1][start_col]  # Path must be clear
-
-                # Capture moves (including en passant)
-                if row_diff == 1 and abs(col_diff) == 1:
-                    # Normal capture
-                    if target:
-                        return True
-                    # En passant
-                    if (self.last_move and
-                            self.board[start_row][end_col] and
-                            self.board[start_row][end_col].name == "pawn" and
-                            self.board[start_row][end_col].en_passant_vulnerable):
-                        return True
-
-            return False
-
-        elif piece.name == "knight":
-            # Knights move in L-shape and can jump over pieces
-            return (abs(row_diff), abs(col_diff)) in [(2, 1), (1, 2)]
-
-        elif piece.name == "king":
-            # Normal king move (one square in any direction)
-            if abs(row_diff) <= 1 and abs(col_diff) <= 1:
-                return True
-
-            # Castling
-            if not piece.has_moved and abs(col_diff) == 2 and row_diff == 0:
-                # Check if it's a valid castling move
-                return self.is_valid_castling(start, end)
-
-            return False
-
-        # For pieces that move in straight lines (rook, bishop, queen)
-        # Check if the path is clear
-        if piece.name in ["rook", "bishop", "queen"]:
-            # Rook moves (horizontal/vertical)
-            valid_rook_move = row_diff == 0 or col_diff == 0
-            # Bishop moves (diagonal)
-            valid_bishop_move = abs(row_diff) == abs(col_diff)
-
-            # Determine if the piece can move this way
-            if piece.name == "rook" and not valid_rook_move:
-                return False
-            if piece.name == "bishop" and not valid_bishop_move:
-                return False
-            if piece.name == "queen" and not (valid_rook_move or valid_bishop_move):
-                return False
-
-            # Check if path is clear
-            row_step = 0 if row_diff == 0 else row_diff // abs(row_diff)
-            col_step = 0 if col_diff == 0 else col_diff // abs(col_diff)
-
-            current_row = start_row + row_step
-            current_col = start_col + col_step
-
-            while (current_row, current_col) != (end_row, end_col):
-                if self.board[current_row][current_col]:
-                    return False
-                current_row += row_step
-                current_col += col_step
-
-            return True
-
-        return False
-
-    def is_in_check(self, color):
-        """
-        Determine if the king of the specified color is in check
-        """
-        # Find the king's position
-        king_pos = self.find_king(color)
-        if not king_pos:
-            return False
-
-        # Check if any opponent's piece can attack the king
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece and piece.color != color:
-                    if self.is_valid_basic_move((row, col), king_pos):
-                        return True
-        return False
-
-    def is_valid_move(self, start, end):
-        if not start or not end:
-            return False
-
-        start_row, start_col = start
-        end_row, end_col = end
-        piece = self.board[start_row][start_col]
-
-        # Basic boundary checks
-        if not (0 <= start_row < self.board_size and
-                0 <= start_col < self.board_size and
-                0 <= end_row < self.board_size and
-                0 <= end_col < self.board_size):
-            return False
-
-        # For castling moves
-        if piece and piece.name == "king" and abs(end_col - start_col) == 2:
-            return self.is_valid_castling(start, end)
-
-        # Check basic move validity
-        if not self.is_valid_basic_move(start, end):
-            return False
-
-        # Check if move puts or leaves king in check
-        if self.move_puts_in_check(start, end):
-            return False
-
-        return True
-
-    def promote_pawn(self, row, col):
+    def promote_pawn(self, start, end):
+        """Ask which piece the pawn promotes to, then play the move"""
         # Create promotion window
         promotion_window = tk.Toplevel(self.root)
         promotion_window.title("Pawn Promotion")
@@ -1190,9 +753,8 @@ class ChessGame:
         pieces = ["queen", "rook", "bishop", "knight"]
 
         def promote_to(piece_name):
-            self.board[row][col] = ChessPiece(self.board[row][col].color, piece_name)
             promotion_window.destroy()
-            self.draw_board()
+            self.make_move(start, end, piece_name)
 
         # Create buttons for each piece option
         for i, piece in enumerate(pieces):
@@ -1217,6 +779,7 @@ class ChessGame:
             self.game_over("White")
 
     def game_over(self, winner):
+        self.engine.stop_pondering()
         game_over_window = tk.Toplevel(self.root)
         game_over_window.title("Game Over")
         game_over_window.geometry("300x200")
@@ -1256,124 +819,106 @@ class ChessGame:
         # Disable the main game window while showing game over
         self.canvas.unbind('<Button-1>')  # Prevent further moves
 
-    def get_piece_value(self, piece):
-        """Return the standard piece values"""
-        values = {
-            "pawn": 1,
-            "knight": 3,
-            "bishop": 3.25,  # Slightly higher than knight
-            "rook": 5,
-            "queen": 9,
-            "king": 0  # King's value isn't counted in material
-        }
-        return values.get(piece.name, 0)
-
     def evaluate_position(self):
         """
-        Evaluate the current position
-        Returns a score (positive favors white, negative favors black)
+        Evaluate the current position from the incrementally updated material
+        and piece-square sums; probe_tablebase replaces it with the exact
+        result of a covered endgame.
+        Returns a score in pawns (positive favors white, negative favors black)
         """
-        white_score = 0
-        black_score = 0
-
-        # Material counting
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece:
-                    value = self.get_piece_value(piece)
-
-                    # Add position-based bonuses
-                    if piece.name == "pawn":
-                        # Pawns are worth more as they advance
-                        if piece.color == "white":
-                            value += (7 - row) * 0.1
-                        else:
-                            value += row * 0.1
-                    elif piece.name in ["knight", "bishop"]:
-                        # Minor pieces are worth more in the center
-                        center_distance = abs(3.5 - row) + abs(3.5 - col)
-                        value += (4 - center_distance) * 0.1
+        return self.position.evaluate() / 100
+
+    def probe_tablebase(self):
+        """Look the position up in the tablebase on the engine loop, showing the exact result when it arrives"""
+        if self.tablebase_request is not None:
+            self.tablebase_request.cancel()
+        request = self.engine.probe_tablebase(self.engine_board)
+        self.tablebase_request = request
+        white_to_move = self.current_player == "white"
+
+        def deliver():
+            if request is not self.tablebase_request:
+                return  # The position has changed since
+            self.tablebase_request = None
+            try:
+                score = request.result()
+            except Exception as e:
+                print(f"Error probing tablebase: {e}")
+                return
+            if score is not None:
+                self.update_evaluation_display(score if white_to_move else -score)
 
-                    if piece.color == "white":
-                        white_score += value
-                    else:
-                        black_score += value
+        request.add_done_callback(lambda _: self.root.after(0, deliver))
 
-        # Check and checkmate evaluation
-        if self.is_in_check("black"):
-            if self.is_checkmate("black"):
-                white_score += 100  # Checkmate
-            else:
-                white_score += 0.5  # Check
+    def toggle_analysis(self):
+        """Turn streaming engine analysis of the evaluation bar on or off"""
+        self.analysis_enabled = not self.analysis_enabled
+        self.analysis_button.config(text=f"Analysis: {'On' if self.analysis_enabled else 'Off'}")
+        if self.analysis_enabled:
+            if self.analyser is None:
+                self.analyser = ChessEngine()
 
-        if self.is_in_check("white"):
-            if self.is_checkmate("white"):
-                black_score += 100  # Checkmate
-            else:
-                black_score += 0.5  # Check
+                def check_leased(ready):
+                    # Runs on the engine loop; the pool may have no engine to spare
+                    if ready.result() is None:
+                        self.root.after(0, self.analysis_unavailable)
 
-        return white_score - black_score
+                self.analyser.start().add_done_callback(check_leased)
+        else:
+            self.stop_analysis()
+        self.update_evaluation_display()
 
-    def evaluate_position(self):
+    def analysis_unavailable(self):
+        """Turn analysis back off when no engine could be leased for it"""
+        if self.analyser is not None:
+            self.analyser.close()
+            self.analyser = None
+        if self.analysis_enabled:
+            self.toggle_analysis()
+        self.analysis_label.config(text="No engine free\nfor analysis")
+
+    def analyse_position(self):
+        """Stream engine analysis of the current position to the evaluation bar"""
+        self.stop_analysis()
+
+        def on_info(info):
+            # Called on the engine loop thread; the display is updated on the Tk thread
+            self.root.after(0, lambda: self.show_analysis(request, info))
+
+        request = self.analyser.analyse(self.engine_board, on_info)
+        self.analysis = request
+
+    def show_analysis(self, request, info):
+        if request is not self.analysis:
+            return  # Analysis of a position that has been left
+        self.update_evaluation_display(info.score)
+        speed = f"  {info.nps // 1000} kN/s" if info.nps else ""
+        self.analysis_label.config(
+            text=f"Depth {info.depth}{speed}\n{' '.join(move.uci() for move in info.pv[:4])}")
+
+    def stop_analysis(self):
+        if self.analysis is not None:
+            self.analysis.cancel()
+            self.analysis = None
+        self.analysis_label.config(text="")
+
+    def update_evaluation_display(self, eval_score=None):
         """
-        Evaluate the current position
-        Returns a score (positive favors white, negative favors black)
+        Update the evaluation bar and material count. Without a score, show
+        the static evaluation and, if analysis is on, start analysing the
+        position; the engine's scores then replace it as they arrive.
         """
-        white_score = 0
-        black_score = 0
+        if eval_score is None:
+            eval_score = self.evaluate_position()
+            if self.tablebase:
+                self.probe_tablebase()
+            if self.analysis_enabled:
+                self.analyse_position()
+        self.evaluation = eval_score
 
-        # Material counting
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece:
-                    value = self.get_piece_value(piece)
-                    if piece.color == "white":
-                        white_score += value
-                    else:
-                        black_score += value
-
-        # Position evaluation (basic)
-        # Center control
-        center_squares = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        for row, col in center_squares:
-            piece = self.board[row][col]
-            if piece:
-                bonus = 0.2
-                if piece.color == "white":
-                    white_score += bonus
-                else:
-                    black_score += bonus
-
-        # King safety
-        white_king_pos = self.find_king("white")
-        black_king_pos = self.find_king("black")
-
-        if white_king_pos:
-            if self.is_in_check("white"):
-                white_score -= 0.5
-        if black_king_pos:
-            if self.is_in_check("black"):
-                black_score -= 0.5
-
-        return white_score - black_score
-
-    def update_evaluation_display(self):
-        """Update the evaluation bar and material count"""
-        eval_score = self.evaluate_position()
-
-        # Calculate material count
-        white_material = 0
-        black_material = 0
-        for row in self.board:
-            for piece in row:
-                if piece:
-                    value = self.get_piece_value(piece)
-                    if piece.color == "white":
-                        white_material += value
-                    else:
-                        black_material += value
+        # Material count is kept up to date by the position
+        white_material = self.position.material["white"]
+        black_material = self.position.material["black"]
 
         # Update material count labels with piece symbols
         # Convert to int for string multiplication
@@ -1431,25 +976,16 @@ class ChessGame:
             font=("Helvetica", 12, "bold")
         )
 
-    def find_king(self, color):
-        """
-        Find the position of the king of the specified color
-        Returns: tuple (row, col) or None if not found
-        """
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                piece = self.board[row][col]
-                if piece and piece.name == "king" and piece.color == color:
-                    return (row, col)
-        return None
-
     def reset_game(self):
+        # Abandon any engine search of the old game and start a new one
+        self.cancel_engine_request()
+        self.engine.new_game()
+        if self.analyser is not None:
+            self.analyser.new_game()
         # Reset board and game state
-        self.board = [[None for _ in range(self.board_size)] for _ in range(self.board_size)]
-        self.create_pieces()
-        self.current_player = "white"
+        self.position = Position.starting_position()
+        self.engine_board = chess.Board()
         self.selected_piece = None
-        self.last_move = None
         self.turn_label.config(text="White's turn")
         self.draw_board()
         # Update evaluation after reset
@@ -1470,67 +1006,26 @@ class ChessGame:
                   text="Undo",
                   command=self.undo_move).pack(side=tk.LEFT, padx=10)
 
-    def get_pins(self, color):
-        pins = []
-        king_pos = self.find_king(color)
-        if not king_pos:
-            return pins
+    def undo_move(self):
+        """Take back the last move, or the last move pair against the computer"""
+        if self.engine_thinking or not self.position.move_history:
+            return
 
-        king_row, king_col = king_pos
+        plies = 1
+        if self.game_mode == "single_player" and self.current_player == self.player_color:
+            plies = 2  # The engine's reply and the player's move
+        for _ in range(min(plies, len(self.position.move_history))):
+            self.position.unmake_move(self.position.move_history[-1])
+            self.engine_board.pop()
+        self.engine.stop_pondering()
 
-        # Check all directions for pins
-        directions = [
-            (-1, 0), (1, 0), (0, -1), (0, 1),  # Rook directions
-            (-1, -1), (-1, 1), (1, -1), (1, 1)  # Bishop directions
-        ]
-
-        for direction in directions:
-            possible_pin = None
-            for i in range(1, 8):
-                row = king_row + direction[0] * i
-                col = king_col + direction[1] * i
-
-                if not (0 <= row < 8 and 0 <= col < 8):
-                    break
-
-                current_piece = self.board[row][col]
-                if current_piece:
-                    if current_piece.color == color:
-                        if possible_pin is None:
-                            possible_pin = (row, col, direction[0], direction[1])
-                        else:
-                            break
-                    else:
-                        # Check if piece can pin
-                        if possible_pin:
-                            piece_name = current_piece.name
-                            if ((piece_name == "rook" and direction[0] * direction[1] == 0) or
-                                    (piece_name == "bishop" and direction[0] * direction[1] != 0) or
-                                    (piece_name == "queen")):
-                                pins.append(possible_pin)
-                        break
-        return pins
-
-    def get_checks(self, color):
-        checks = []
-        king_pos = self.find_king(color)
-        if not king_pos:
-            return checks
-
-        king_row, king_col = king_pos
-
-        # Check all possible attacking pieces
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color != color:
-                    if self.is_valid_basic_move((row, col), king_pos):
-                        checks.append((row, col))
-        return checks
+        self.selected_piece = None
+        self.turn_label.config(text=f"{self.current_player.capitalize()}'s turn")
+        self.draw_board()
+        self.update_evaluation_display()
 
-    def undo_move(self):
-        # Implement move history and undo functionality
-        pass
+        if self.game_mode == "single_player" and self.current_player != self.player_color:
+            self.root.after(500, self.make_computer_move)
 
     def return_to_menu(self):
         """Return to the main menu"""
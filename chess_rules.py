@@ -0,0 +1,996 @@
+"""
+Headless chess rules.
+
+Position holds the board and game state and implements the rules of chess
+without any tkinter or engine dependency, so it can be created cheaply for
+move validation, perft and worker processes. ChessGame is a view over it.
+"""
+
+from collections import namedtuple
+
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+
+from chess_eval import ENDGAME_SCORES, MIDGAME_SCORES, PHASE_WEIGHTS, PIECE_VALUES, piece_scores, taper
+
+# A move from one (row, col) square to another; promotion names the new piece
+Move = namedtuple("Move", ["start", "end", "promotion"], defaults=(None,))
+
+# Everything make_move changes that unmake_move cannot recompute
+UndoInfo = namedtuple("UndoInfo", [
+    "move", "piece", "captured", "captured_square", "rook_move",
+    "castling_rights", "ep_square", "halfmove_clock", "last_move", "key",
+    "legal_moves", "legal_targets", "scores", "current_player",
+])
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+SLIDER_DIRECTIONS = {
+    "rook": ROOK_DIRECTIONS,
+    "bishop": BISHOP_DIRECTIONS,
+    "queen": ROOK_DIRECTIONS + BISHOP_DIRECTIONS,
+}
+PROMOTION_PIECES = ["queen", "rook", "bishop", "knight"]
+
+FEN_PIECES = {"p": "pawn", "n": "knight", "b": "bishop", "r": "rook", "q": "queen", "k": "king"}
+FEN_SYMBOLS = {name: symbol for symbol, name in FEN_PIECES.items()}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def square_name(square):
+    """Convert a (row, col) square to algebraic notation, e.g. (7, 4) -> 'e1'"""
+    row, col = square
+    return f"{chr(ord('a') + col)}{8 - row}"
+
+
+def parse_square(name):
+    """Convert algebraic notation to a (row, col) square"""
+    return (8 - int(name[1]), ord(name[0]) - ord('a'))
+
+
+def move_to_uci(move):
+    """Convert a Move to UCI notation, e.g. 'e7e8q'"""
+    uci = square_name(move.start) + square_name(move.end)
+    if move.promotion:
+        uci += FEN_SYMBOLS[move.promotion]
+    return uci
+
+
+def parse_uci(uci):
+    """Convert UCI notation to a Move"""
+    promotion = FEN_PIECES[uci[4]] if len(uci) > 4 else None
+    return Move(parse_square(uci[:2]), parse_square(uci[2:4]), promotion)
+
+
+# Castling rights (FEN letters) lost when a move leaves or lands on these squares
+CASTLING_SQUARES = {
+    (7, 4): "KQ", (7, 7): "K", (7, 0): "Q",
+    (0, 4): "kq", (0, 7): "k", (0, 0): "q",
+}
+
+
+def _on_board(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def _offset_table(offsets):
+    """For each square index (row * 8 + col), the squares reached by the offsets"""
+    return [[(row + dr, col + dc) for dr, dc in offsets if _on_board(row + dr, col + dc)]
+            for row in range(8) for col in range(8)]
+
+
+def _ray_table():
+    """For each square index, the squares along each rook then bishop direction"""
+    table = []
+    for row in range(8):
+        for col in range(8):
+            rays = []
+            for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+                ray = []
+                r, c = row + dr, col + dc
+                while _on_board(r, c):
+                    ray.append((r, c))
+                    r += dr
+                    c += dc
+                rays.append(ray)
+            table.append(rays)
+    return table
+
+
+# Precomputed attack tables, indexed by row * 8 + col
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(KING_OFFSETS)
+PAWN_ATTACKS = {
+    "white": _offset_table([(-1, -1), (-1, 1)]),
+    "black": _offset_table([(1, -1), (1, 1)]),
+}
+RAYS = _ray_table()
+# Pieces that attack along the first four (rook) and last four (bishop) rays
+RAY_ATTACKERS = [("rook", "queen")] * 4 + [("bishop", "queen")] * 4
+
+
+def _zobrist_piece_table():
+    """Polyglot piece keys as table[color][name][row * 8 + col]"""
+    table = {}
+    for color in ("white", "black"):
+        table[color] = {}
+        for kind, name in enumerate(["pawn", "knight", "bishop", "rook", "queen", "king"]):
+            offset = 64 * (2 * kind + (color == "white"))
+            table[color][name] = [POLYGLOT_RANDOM_ARRAY[offset + 8 * (7 - row) + col]
+                                  for row in range(8) for col in range(8)]
+    return table
+
+
+# Zobrist keys, laid out as in the Polyglot book format so the same hash can probe books
+ZOBRIST_PIECES = _zobrist_piece_table()
+ZOBRIST_CASTLING = dict(zip("KQkq", POLYGLOT_RANDOM_ARRAY[768:772]))
+ZOBRIST_EP_FILES = POLYGLOT_RANDOM_ARRAY[772:780]
+ZOBRIST_WHITE_TO_MOVE = POLYGLOT_RANDOM_ARRAY[780]
+
+
+class ChessPiece:
+    def __init__(self, color, name):
+        self.color = color
+        self.name = name
+
+
+class Position:
+    """Board and game state plus the rules engine that operates on it"""
+
+    board_size = 8
+
+    def __init__(self):
+        self.board = [[None for _ in range(self.board_size)] for _ in range(self.board_size)]
+        self.current_player = "white"
+        self.last_move = None
+        self.castling_rights = ""
+        self.ep_square = None  # Square a pawn may capture into en passant
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.king_squares = {}
+        self.key = 0
+        self.key_history = []  # Zobrist keys of every position reached, current one last
+        self.move_history = []  # UndoInfo records of the moves played so far
+        # Evaluation sums kept up to date by make_move, positive for white
+        self.midgame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        self.material = {"white": 0, "black": 0}
+        # Legal moves of the side to move, built on first use and cleared by a move
+        self._legal_moves = None
+        self._legal_targets = None
+
+    @classmethod
+    def starting_position(cls):
+        """Create a position with the pieces in their initial squares"""
+        position = cls()
+        position.create_pieces()
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Create a position from a FEN string"""
+        position = cls()
+        fields = fen.split()
+        for row, rank_text in enumerate(fields[0].split("/")):
+            col = 0
+            for symbol in rank_text:
+                if symbol.isdigit():
+                    col += int(symbol)
+                    continue
+                color = "white" if symbol.isupper() else "black"
+                name = FEN_PIECES[symbol.lower()]
+                position.board[row][col] = ChessPiece(color, name)
+                if name == "king":
+                    position.king_squares[color] = (row, col)
+                col += 1
+
+        position.current_player = "black" if len(fields) > 1 and fields[1] == "b" else "white"
+        if len(fields) > 2 and fields[2] != "-":
+            position.castling_rights = "".join(right for right in "KQkq" if right in fields[2])
+        if len(fields) > 3 and fields[3] != "-":
+            position.ep_square = parse_square(fields[3])
+        if len(fields) > 5:
+            position.halfmove_clock = int(fields[4])
+            position.fullmove_number = int(fields[5])
+
+        position.key = position.compute_key()
+        position.key_history = [position.key]
+        position.compute_scores()
+        return position
+
+    def create_pieces(self):
+        # Add pawns
+        for col in range(self.board_size):
+            self.board[1][col] = ChessPiece("black", "pawn")
+            self.board[6][col] = ChessPiece("white", "pawn")
+
+        # Add other pieces
+        piece_order = ["rook", "knight", "bishop", "queen", "king", "bishop", "knight", "rook"]
+        for col, piece_name in enumerate(piece_order):
+            self.board[0][col] = ChessPiece("black", piece_name)
+            self.board[7][col] = ChessPiece("white", piece_name)
+        self.castling_rights = "KQkq"
+        self.king_squares = {"white": (7, 4), "black": (0, 4)}
+        self.key = self.compute_key()
+        self.key_history = [self.key]
+        self.compute_scores()
+
+    def _ep_key(self):
+        """
+        Zobrist term for the en passant square. As in Polyglot, it only counts
+        when a pawn of the side to move stands ready to capture.
+        """
+        if not self.ep_square:
+            return 0
+        ep_row, col = self.ep_square
+        row = ep_row + 1 if self.current_player == "white" else ep_row - 1
+        for pawn_col in (col - 1, col + 1):
+            if 0 <= pawn_col < 8:
+                piece = self.board[row][pawn_col]
+                if piece and piece.name == "pawn" and piece.color == self.current_player:
+                    return ZOBRIST_EP_FILES[col]
+        return 0
+
+    def compute_key(self):
+        """Compute the Zobrist key of the position from scratch"""
+        key = 0
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece:
+                    key ^= ZOBRIST_PIECES[piece.color][piece.name][row * 8 + col]
+        for right in self.castling_rights:
+            key ^= ZOBRIST_CASTLING[right]
+        key ^= self._ep_key()
+        if self.current_player == "white":
+            key ^= ZOBRIST_WHITE_TO_MOVE
+        return key
+
+    def compute_scores(self):
+        """Compute the material, phase and piece-square sums from scratch"""
+        self.midgame_score = 0
+        self.endgame_score = 0
+        self.phase = 0
+        self.material = {"white": 0, "black": 0}
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece:
+                    midgame, endgame = piece_scores(piece.color, piece.name, row, col)
+                    self.midgame_score += midgame
+                    self.endgame_score += endgame
+                    self.phase += PHASE_WEIGHTS[piece.name]
+                    self.material[piece.color] += PIECE_VALUES[piece.name]
+
+    def evaluate(self):
+        """Static evaluation in centipawns, positive favors white"""
+        return taper(self.midgame_score, self.endgame_score, self.phase)
+
+    def board_to_fen(self):
+        """Convert current board position to FEN string"""
+        fen = []
+        for row in range(self.board_size):
+            empty = 0
+            row_fen = ''
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece is None:
+                    empty += 1
+                else:
+                    if empty > 0:
+                        row_fen += str(empty)
+                        empty = 0
+                    # Convert piece to FEN notation
+                    symbol = piece.name[0].upper() if piece.name != 'knight' else 'N'
+                    if piece.color == 'black':
+                        symbol = symbol.lower()
+                    row_fen += symbol
+            if empty > 0:
+                row_fen += str(empty)
+            fen.append(row_fen)
+
+        # Join rows and add other FEN components
+        fen_str = '/'.join(fen)
+        fen_str += f" {'w' if self.current_player == 'white' else 'b'}"
+        fen_str += f" {self.castling_rights or '-'}"
+        fen_str += f" {square_name(self.ep_square) if self.ep_square else '-'}"
+        fen_str += f" {self.halfmove_clock} {self.fullmove_number}"
+        return fen_str
+
+    def piece_at(self, square):
+        """The ChessPiece on a (row, col) square, or None"""
+        return self.board[square[0]][square[1]]
+
+    def remove_piece(self, square):
+        """
+        Lift the piece off a (row, col) square and return it, for probing the
+        board. The key and evaluation are not updated: put it back with
+        put_piece before the next move.
+        """
+        row, col = square
+        piece = self.board[row][col]
+        self.board[row][col] = None
+        return piece
+
+    def put_piece(self, square, piece):
+        """Put back a piece lifted by remove_piece"""
+        self.board[square[0]][square[1]] = piece
+
+    def find_king(self, color):
+        """
+        Find the position of the king of the specified color
+        Returns: tuple (row, col) or None if not found
+        """
+        return self.king_squares.get(color)
+
+    def is_valid_basic_move(self, start, end):
+        start_row, start_col = start
+        end_row, end_col = end
+
+        # Basic boundary checks
+        if not (0 <= start_row < 8 and 0 <= start_col < 8 and 0 <= end_row < 8 and 0 <= end_col < 8):
+            return False
+
+        piece = self.board[start_row][start_col]
+        target = self.board[end_row][end_col]
+
+        # Must have a piece to move
+        if not piece:
+            return False
+
+        # Can't capture own pieces
+        if target and target.color == piece.color:
+            return False
+
+        # Calculate move deltas
+        row_diff = end_row - start_row
+        col_diff = end_col - start_col
+
+        # Check piece-specific movement rules
+        if piece.name == "pawn":
+            direction = -1 if piece.color == "white" else 1
+
+            # Normal move forward
+            if col_diff == 0 and not target:
+                if row_diff == direction:
+                    return True
+                # First move can be two squares
+                if start_row == (6 if piece.color == "white" else 1) and row_diff == 2 * direction:
+                    return not self.board[start_row + direction][start_col]  # Path must be clear
+
+            # Capture moves (including en passant)
+            if row_diff == direction and abs(col_diff) == 1:
+                # Normal capture
+                if target:
+                    return True
+                # En passant
+                if end == self.ep_square:
+                    return True
+
+            return False
+
+        elif piece.name == "knight":
+            # Knights move in L-shape and can jump over pieces
+            return (abs(row_diff), abs(col_diff)) in [(2, 1), (1, 2)]
+
+        elif piece.name == "king":
+            # Normal king move (one square in any direction)
+            if abs(row_diff) <= 1 and abs(col_diff) <= 1:
+                return True
+
+            # Castling
+            if abs(col_diff) == 2 and row_diff == 0:
+                # Check if it's a valid castling move
+                return self.is_valid_castling(start, end)
+
+            return False
+
+        # For pieces that move in straight lines (rook, bishop, queen)
+        # Check if the path is clear
+        if piece.name in ["rook", "bishop", "queen"]:
+            # Rook moves (horizontal/vertical)
+            valid_rook_move = row_diff == 0 or col_diff == 0
+            # Bishop moves (diagonal)
+            valid_bishop_move = abs(row_diff) == abs(col_diff)
+
+            # Determine if the piece can move this way
+            if piece.name == "rook" and not valid_rook_move:
+                return False
+            if piece.name == "bishop" and not valid_bishop_move:
+                return False
+            if piece.name == "queen" and not (valid_rook_move or valid_bishop_move):
+                return False
+
+            # Check if path is clear
+            row_step = 0 if row_diff == 0 else row_diff // abs(row_diff)
+            col_step = 0 if col_diff == 0 else col_diff // abs(col_diff)
+
+            current_row = start_row + row_step
+            current_col = start_col + col_step
+
+            while (current_row, current_col) != (end_row, end_col):
+                if self.board[current_row][current_col]:
+                    return False
+                current_row += row_step
+                current_col += col_step
+
+            return True
+
+        return False
+
+    def is_valid_castling(self, start, end):
+        start_row, start_col = start
+        end_row, end_col = end
+        king = self.board[start_row][start_col]
+        home_row = 7 if king.color == "white" else 0
+        if start != (home_row, 4) or end_row != home_row:
+            return False
+
+        # Determine rook position and target squares
+        if end_col > start_col:  # Kingside castling
+            right = "K"
+            rook_col = 7
+            path_cols = [5, 6]  # Squares that must be empty and safe
+            through_squares = [(start_row, 5), (start_row, 6)]  # Squares the king moves through
+        else:  # Queenside castling
+            right = "Q"
+            rook_col = 0
+            path_cols = [1, 2, 3]  # Squares that must be empty and safe
+            through_squares = [(start_row, 2), (start_row, 3)]  # Squares the king moves through
+        if king.color == "black":
+            right = right.lower()
+
+        # Basic checks
+        if right not in self.castling_rights or self.is_in_check(king.color):
+            return False
+
+        # Check if rook is in position
+        rook = self.board[start_row][rook_col]
+        if not rook or rook.name != "rook" or rook.color != king.color:
+            return False
+
+        # Check if squares between king and rook are empty
+        for col in path_cols:
+            if self.board[start_row][col] is not None:
+                return False
+
+        # Check if the king moves through or ends up on any square that is under attack
+        enemy = "black" if king.color == "white" else "white"
+        for square in through_squares:
+            if self.is_square_attacked(square, enemy):
+                return False
+
+        return True
+
+    def get_attackers(self, square, by_color):
+        """
+        Yield the squares of the pieces of by_color that attack the given square.
+        Looks outward from the square through the precomputed attack tables.
+        """
+        board = self.board
+        index = square[0] * 8 + square[1]
+
+        for row, col in KNIGHT_ATTACKS[index]:
+            piece = board[row][col]
+            if piece and piece.name == "knight" and piece.color == by_color:
+                yield (row, col)
+
+        # A pawn attacks the square if a pawn of the other color on it would attack back
+        defender = "black" if by_color == "white" else "white"
+        for row, col in PAWN_ATTACKS[defender][index]:
+            piece = board[row][col]
+            if piece and piece.name == "pawn" and piece.color == by_color:
+                yield (row, col)
+
+        for row, col in KING_ATTACKS[index]:
+            piece = board[row][col]
+            if piece and piece.name == "king" and piece.color == by_color:
+                yield (row, col)
+
+        for ray, attackers in zip(RAYS[index], RAY_ATTACKERS):
+            for row, col in ray:
+                piece = board[row][col]
+                if piece:
+                    if piece.color == by_color and piece.name in attackers:
+                        yield (row, col)
+                    break
+
+    def is_square_attacked(self, square, by_color):
+        """Check if any piece of by_color attacks the given square"""
+        for _ in self.get_attackers(square, by_color):
+            return True
+        return False
+
+    def is_in_check(self, color):
+        """
+        Determine if the king of the specified color is in check
+        """
+        # Find the king's position
+        king_pos = self.find_king(color)
+        if not king_pos:
+            return False
+
+        return self.is_square_attacked(king_pos, "black" if color == "white" else "white")
+
+    def move_puts_in_check(self, start, end):
+        """
+        Check if making this move would put or leave the player's king in check
+        """
+        color = self.board[start[0]][start[1]].color
+        undo = self.make_move(Move(start, end))
+        in_check = self.is_in_check(color)
+        self.unmake_move(undo)
+        return in_check
+
+    def is_valid_move(self, start, end):
+        if not start or not end:
+            return False
+
+        start_row, start_col = start
+        end_row, end_col = end
+
+        # Basic boundary checks
+        if not (0 <= start_row < self.board_size and
+                0 <= start_col < self.board_size and
+                0 <= end_row < self.board_size and
+                0 <= end_col < self.board_size):
+            return False
+
+        piece = self.board[start_row][start_col]
+
+        # The side to move is answered from the cached legal move list
+        if piece and piece.color == self.current_player:
+            return (end_row, end_col) in self.legal_targets().get((start_row, start_col), ())
+
+        # For castling moves
+        if piece and piece.name == "king" and abs(end_col - start_col) == 2:
+            return self.is_valid_castling(start, end)
+
+        # Check basic move validity
+        if not self.is_valid_basic_move(start, end):
+            return False
+
+        # Check if move puts or leaves king in check
+        if self.move_puts_in_check(start, end):
+            return False
+
+        return True
+
+    def generate_piece_moves(self, start):
+        """
+        Yield the pseudo-legal moves of the piece on the start square.
+        Sliders stop at the first blocker; the moves may still leave the
+        king in check, except castling which is fully validated here.
+        """
+        start_row, start_col = start
+        piece = self.board[start_row][start_col]
+        if not piece:
+            return
+        board = self.board
+        color = piece.color
+
+        if piece.name == "pawn":
+            direction = -1 if color == "white" else 1
+            row = start_row + direction
+            if not 0 <= row < 8:
+                return
+            last_rank = row in (0, 7)
+            targets = []
+
+            # Pushes, with the double step from the starting square
+            if board[row][start_col] is None:
+                targets.append((row, start_col))
+                if start_row == (6 if color == "white" else 1):
+                    double_row = row + direction
+                    if board[double_row][start_col] is None:
+                        targets.append((double_row, start_col))
+
+            # Captures, including en passant
+            for col in (start_col - 1, start_col + 1):
+                if not 0 <= col < 8:
+                    continue
+                target = board[row][col]
+                if target:
+                    if target.color != color:
+                        targets.append((row, col))
+                elif (row, col) == self.ep_square:
+                    targets.append((row, col))
+
+            for end in targets:
+                if last_rank:
+                    for promotion in PROMOTION_PIECES:
+                        yield Move(start, end, promotion)
+                else:
+                    yield Move(start, end)
+
+        elif piece.name in ("knight", "king"):
+            offsets = KNIGHT_OFFSETS if piece.name == "knight" else KING_OFFSETS
+            for row_step, col_step in offsets:
+                row = start_row + row_step
+                col = start_col + col_step
+                if 0 <= row < 8 and 0 <= col < 8:
+                    target = board[row][col]
+                    if target is None or target.color != color:
+                        yield Move(start, (row, col))
+
+            # Castling
+            if piece.name == "king" and start_col == 4 and self.castling_rights:
+                for end_col in (6, 2):
+                    if self.is_valid_castling(start, (start_row, end_col)):
+                        yield Move(start, (start_row, end_col))
+
+        else:
+            for row_step, col_step in SLIDER_DIRECTIONS[piece.name]:
+                row = start_row + row_step
+                col = start_col + col_step
+                while 0 <= row < 8 and 0 <= col < 8:
+                    target = board[row][col]
+                    if target is None:
+                        yield Move(start, (row, col))
+                    else:
+                        if target.color != color:
+                            yield Move(start, (row, col))
+                        break
+                    row += row_step
+                    col += col_step
+
+    def generate_pseudo_legal_moves(self, color=None):
+        """Yield the pseudo-legal moves of every piece of the given color"""
+        color = color or self.current_player
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece and piece.color == color:
+                    yield from self.generate_piece_moves((row, col))
+
+    def captured_piece(self, move):
+        """The piece a move captures, including a pawn taken en passant, or None"""
+        (start_row, start_col), (end_row, end_col) = move.start, move.end
+        target = self.board[end_row][end_col]
+        if target is None and move.end == self.ep_square and self.board[start_row][start_col].name == "pawn":
+            return self.board[start_row][end_col]
+        return target
+
+    def is_legal(self, move):
+        """Check that a pseudo-legal move does not leave the mover's king in check"""
+        start, end = move.start, move.end
+        piece = self.board[start[0]][start[1]]
+        # Castling candidates are already validated by the generator
+        if piece.name == "king" and abs(end[1] - start[1]) == 2:
+            return True
+        undo = self.make_move(move)
+        in_check = self.is_in_check(piece.color)
+        self.unmake_move(undo)
+        return not in_check
+
+    def generate_legal_moves(self, color=None):
+        """Yield the legal moves for the given color, defaulting to the side to move"""
+        for move in self.generate_pseudo_legal_moves(color):
+            if self.is_legal(move):
+                yield move
+
+    def legal_moves(self):
+        """
+        The legal moves of the side to move. Generated once per position and
+        reused until the position changes.
+        """
+        if self._legal_moves is None:
+            self._legal_moves = list(self.generate_legal_moves())
+            self._legal_targets = None
+        return self._legal_moves
+
+    def legal_targets(self):
+        """Map each start square of the side to move to its legal target squares"""
+        if self._legal_targets is None:
+            targets = {}
+            for move in self.legal_moves():
+                ends = targets.setdefault(move.start, [])
+                # Promotions produce one move per piece for the same target square
+                if move.end not in ends:
+                    ends.append(move.end)
+            self._legal_targets = targets
+        return self._legal_targets
+
+    def get_valid_moves(self, start):
+        """
+        Get all valid target squares for a piece at the given position
+        """
+        if not start:
+            return []
+
+        piece = self.board[start[0]][start[1]]
+        if piece and piece.color == self.current_player:
+            return list(self.legal_targets().get(tuple(start), ()))
+
+        valid_moves = []
+        for move in self.generate_piece_moves(start):
+            # Promotions produce one move per piece for the same target square
+            if move.end not in valid_moves and self.is_legal(move):
+                valid_moves.append(move.end)
+        return valid_moves
+
+    def has_valid_moves(self, color):
+        """
+        Check if the specified color has any valid moves
+        """
+        if color == self.current_player:
+            return bool(self.legal_moves())
+        return any(True for _ in self.generate_legal_moves(color))
+
+    def is_checkmate(self, color):
+        """
+        Check if the specified color is in checkmate
+        """
+        # If not in check, it's not checkmate
+        if not self.is_in_check(color):
+            return False
+
+        # If in check, see if there are any valid moves that can get out of check
+        return not self.has_valid_moves(color)
+
+    def is_stalemate(self, color):
+        if self.is_in_check(color):
+            return False
+        return not self.has_valid_moves(color)
+
+    def make_move(self, move):
+        """
+        Play a pseudo-legal move and pass the turn.
+        Returns the UndoInfo that unmake_move needs to restore the position.
+        A pawn reaching the last rank becomes the promotion piece, a queen by default.
+        """
+        board = self.board
+        start, end = move.start, move.end
+        start_row, start_col = start
+        end_row, end_col = end
+        piece = board[start_row][start_col]
+        captured = board[end_row][end_col]
+        captured_square = end
+        rook_move = None
+        pieces = ZOBRIST_PIECES[piece.color]
+        key = self.key ^ self._ep_key() ^ ZOBRIST_WHITE_TO_MOVE
+        midgame_scores = MIDGAME_SCORES[piece.color]
+        endgame_scores = ENDGAME_SCORES[piece.color]
+        scores = (self.midgame_score, self.endgame_score, self.phase,
+                  self.material["white"], self.material["black"])
+        midgame, endgame = self.midgame_score, self.endgame_score
+
+        if piece.name == "pawn":
+            if end == self.ep_square:
+                # En passant removes the pawn beside the moving pawn
+                captured_square = (start_row, end_col)
+                captured = board[start_row][end_col]
+                board[start_row][end_col] = None
+        elif piece.name == "king":
+            self.king_squares[piece.color] = end
+            if abs(end_col - start_col) == 2:
+                # Move the castling rook
+                rook_move = ((start_row, 7), (start_row, 5)) if end_col > start_col \
+                    else ((start_row, 0), (start_row, 3))
+                (rook_row, rook_from), (_, rook_to) = rook_move
+                board[rook_row][rook_to] = board[rook_row][rook_from]
+                board[rook_row][rook_from] = None
+                key ^= pieces["rook"][rook_row * 8 + rook_from] ^ pieces["rook"][rook_row * 8 + rook_to]
+                midgame += midgame_scores["rook"][rook_row * 8 + rook_to] - midgame_scores["rook"][rook_row * 8 + rook_from]
+                endgame += endgame_scores["rook"][rook_row * 8 + rook_to] - endgame_scores["rook"][rook_row * 8 + rook_from]
+
+        undo = UndoInfo(move, piece, captured, captured_square, rook_move, self.castling_rights,
+                        self.ep_square, self.halfmove_clock, self.last_move, self.key,
+                        self._legal_moves, self._legal_targets, scores, self.current_player)
+        self._legal_moves = None
+        self._legal_targets = None
+
+        if captured:
+            captured_row, captured_col = captured_square
+            captured_index = captured_row * 8 + captured_col
+            key ^= ZOBRIST_PIECES[captured.color][captured.name][captured_index]
+            midgame -= MIDGAME_SCORES[captured.color][captured.name][captured_index]
+            endgame -= ENDGAME_SCORES[captured.color][captured.name][captured_index]
+            self.phase -= PHASE_WEIGHTS[captured.name]
+            self.material[captured.color] -= PIECE_VALUES[captured.name]
+
+        # Move piece, promoting pawns that reach the last rank
+        board[start_row][start_col] = None
+        if piece.name == "pawn" and end_row in (0, 7):
+            placed = ChessPiece(piece.color, move.promotion or "queen")
+        else:
+            placed = piece
+        board[end_row][end_col] = placed
+        start_index, end_index = start_row * 8 + start_col, end_row * 8 + end_col
+        key ^= pieces[piece.name][start_index] ^ pieces[placed.name][end_index]
+        midgame += midgame_scores[placed.name][end_index] - midgame_scores[piece.name][start_index]
+        endgame += endgame_scores[placed.name][end_index] - endgame_scores[piece.name][start_index]
+        if placed is not piece:
+            self.phase += PHASE_WEIGHTS[placed.name]
+            self.material[piece.color] += PIECE_VALUES[placed.name] - PIECE_VALUES["pawn"]
+        self.midgame_score, self.endgame_score = midgame, endgame
+
+        # Moving a king or rook, or capturing a rook, gives up castling rights
+        if self.castling_rights:
+            for square in (start, end):
+                lost = CASTLING_SQUARES.get(square)
+                if lost:
+                    for right in lost:
+                        if right in self.castling_rights:
+                            self.castling_rights = self.castling_rights.replace(right, "")
+                            key ^= ZOBRIST_CASTLING[right]
+
+        # A double pawn step can be captured en passant on the square it skipped
+        if piece.name == "pawn" and abs(end_row - start_row) == 2:
+            self.ep_square = ((start_row + end_row) // 2, start_col)
+        else:
+            self.ep_square = None
+
+        # Pawn moves and captures reset the fifty-move counter
+        if piece.name == "pawn" or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if piece.color == "black":
+            self.fullmove_number += 1
+
+        self.last_move = (start, end)
+        self.move_history.append(undo)
+        self.current_player = "black" if piece.color == "white" else "white"
+        self.key = key ^ self._ep_key()
+        self.key_history.append(self.key)
+        return undo
+
+    def unmake_move(self, undo):
+        """Take back the most recent make_move using its UndoInfo"""
+        board = self.board
+        (start_row, start_col), (end_row, end_col) = undo.move.start, undo.move.end
+        piece = undo.piece
+
+        board[start_row][start_col] = piece
+        board[end_row][end_col] = None
+        if undo.captured:
+            captured_row, captured_col = undo.captured_square
+            board[captured_row][captured_col] = undo.captured
+        if piece.name == "king":
+            self.king_squares[piece.color] = undo.move.start
+        if undo.rook_move:
+            (rook_row, rook_from), (_, rook_to) = undo.rook_move
+            board[rook_row][rook_from] = board[rook_row][rook_to]
+            board[rook_row][rook_to] = None
+
+        self.castling_rights = undo.castling_rights
+        self.ep_square = undo.ep_square
+        self.halfmove_clock = undo.halfmove_clock
+        self.last_move = undo.last_move
+        if piece.color == "black":
+            self.fullmove_number -= 1
+        self.move_history.pop()
+        self.key_history.pop()
+        self.key = undo.key
+        self._legal_moves = undo.legal_moves
+        self._legal_targets = undo.legal_targets
+        (self.midgame_score, self.endgame_score, self.phase,
+         self.material["white"], self.material["black"]) = undo.scores
+        # Not always piece.color: legality tests also play moves of the side not to move
+        self.current_player = undo.current_player
+
+    def move_piece(self, start, end, promotion="queen"):
+        """
+        Play a move that has already been validated and pass the turn.
+        A pawn reaching the last rank is replaced by the promotion piece.
+        """
+        return self.make_move(Move(start, end, promotion))
+
+    def get_pins(self, color):
+        pins = []
+        king_pos = self.find_king(color)
+        if not king_pos:
+            return pins
+
+        king_row, king_col = king_pos
+
+        # Check all directions for pins
+        directions = [
+            (-1, 0), (1, 0), (0, -1), (0, 1),  # Rook directions
+            (-1, -1), (-1, 1), (1, -1), (1, 1)  # Bishop directions
+        ]
+
+        for direction in directions:
+            possible_pin = None
+            for i in range(1, 8):
+                row = king_row + direction[0] * i
+                col = king_col + direction[1] * i
+
+                if not (0 <= row < 8 and 0 <= col < 8):
+                    break
+
+                current_piece = self.board[row][col]
+                if current_piece:
+                    if current_piece.color == color:
+                        if possible_pin is None:
+                            possible_pin = (row, col, direction[0], direction[1])
+                        else:
+                            break
+                    else:
+                        # Check if piece can pin
+                        if possible_pin:
+                            piece_name = current_piece.name
+                            if ((piece_name == "rook" and direction[0] * direction[1] == 0) or
+                                    (piece_name == "bishop" and direction[0] * direction[1] != 0) or
+                                    (piece_name == "queen")):
+                                pins.append(possible_pin)
+                        break
+        return pins
+
+    def get_checks(self, color):
+        king_pos = self.find_king(color)
+        if not king_pos:
+            return []
+
+        return list(self.get_attackers(king_pos, "black" if color == "white" else "white"))
+
+    def is_insufficient_material(self):
+        """Check if there's insufficient material for checkmate"""
+        pieces = {'white': [], 'black': []}
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece:
+                    pieces[piece.color].append(piece.name)
+
+        # Remove kings from the count
+        for color in pieces:
+            pieces[color].remove('king')
+
+        # Check insufficient material conditions
+        for color in pieces:
+            if not pieces[color]:  # Only king
+                continue
+            if len(pieces[color]) == 1:
+                if pieces[color][0] in ['bishop', 'knight']:  # King and bishop/knight
+                    continue
+            return False
+        return True
+
+    def repetition_count(self):
+        """
+        Count how often the current position has occurred. Only positions since
+        the last pawn move or capture can repeat, so the key history is scanned
+        no further back than the halfmove clock.
+        """
+        history = self.key_history
+        last = len(history) - 1
+        earliest = max(0, last - self.halfmove_clock)
+        count = 1
+        for index in range(last - 2, earliest - 1, -2):
+            if history[index] == self.key:
+                count += 1
+        return count
+
+    def is_threefold_repetition(self):
+        """Check if the current position has occurred three times"""
+        return self.repetition_count() >= 3
+
+    def is_fifty_move_rule(self):
+        """Check if fifty moves have been made without pawn movement or capture"""
+        return self.halfmove_clock >= 100  # 50 moves = 100 halfmoves
+
+    def is_dead_position(self):
+        """Check if the position is dead (impossible to checkmate)"""
+        pieces = {'white': [], 'black': []}
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                piece = self.board[row][col]
+                if piece:
+                    pieces[piece.color].append(piece.name)
+
+        # King vs King
+        if len(pieces['white']) == 1 and len(pieces['black']) == 1:
+            return True
+
+        # King and bishop/knight vs King
+        for color in ['white', 'black']:
+            other = 'black' if color == 'white' else 'white'
+            if len(pieces[color]) == 2 and len(pieces[other]) == 1:
+                if 'bishop' in pieces[color] or 'knight' in pieces[color]:
+                    return True
+
+        return False
@@ -0,0 +1,556 @@
+"""
+Built-in chess engine: negamax alpha-beta search over the headless rules core.
+
+SearchEngine has the same get_best_move / get_position_evaluation interface as
+ChessEngine, so ChessGame can fall back to it when no UCI binary is available.
+It searches a Position in-process with iterative deepening, stopping at a hard
+time limit and counting the nodes it visits. Results are kept in a
+transposition table that persists between moves, and moves are ordered so
+that alpha-beta can prune: hash move, captures by MVV-LVA, killer moves,
+then quiet moves by the history heuristic. At the horizon a quiescence search
+plays out captures and queen promotions, skipping captures that lose material
+by static exchange evaluation, so scores are not taken mid-exchange.
+
+With workers > 0 the search also runs lazy SMP helpers in a process pool:
+each helper searches the same root at a staggered depth and shares the
+transposition table through shared memory, so the main search finds deeper
+results in the table. The deepest completed result wins. The pool is started
+with the engine and reused for every move.
+
+    python chess_search.py --depth 5                 # nodes-to-depth benchmark
+    python chess_search.py --depth 5 --no-ordering   # the same without move ordering
+    python chess_search.py --depth 6 --workers 15    # time-to-depth with helper processes
+    python chess_search.py --depth 5 --backend bitboard
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import chess
+
+from chess_eval import PIECE_VALUES
+from chess_rules import Position, move_to_uci
+from chess_transposition import EXACT, LOWER_BOUND, MAX_GENERATION, UPPER_BOUND, TranspositionTable
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+# Scores beyond this are mates, stored in the table relative to the node
+MATE_THRESHOLD = MATE_SCORE - 1000
+# The clock is only read every this many nodes
+TIME_CHECK_INTERVAL = 256
+MAX_PLY = 128
+
+# Move ordering priorities, highest first
+HASH_MOVE_PRIORITY = 1000000000
+CAPTURE_PRIORITY = 100000000
+KILLER_PRIORITY = 10000000
+# History scores are halved once any of them reaches this, keeping them below the killers
+HISTORY_LIMIT = 1000000
+
+# Piece values for static exchange evaluation; the king can only capture last
+SEE_VALUES = dict(PIECE_VALUES, king=100)
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time limit has passed"""
+
+
+def static_exchange(position, move):
+    """
+    Material gain, in pawns, of a capture once the exchange it starts on the
+    target square is played out. Both sides recapture with their least
+    valuable attacker and may stop whenever going on would lose material.
+    Pins are ignored; pieces behind a capturing slider join in as x-rays.
+    """
+    start, target = move.start, move.end
+    attacker = position.piece_at(start)
+    victim = position.captured_piece(move)
+    gains = [SEE_VALUES[victim.name] if victim else 0]
+    on_target = SEE_VALUES[attacker.name]
+    if move.promotion:
+        gains[0] += SEE_VALUES[move.promotion] - SEE_VALUES["pawn"]
+        on_target = SEE_VALUES[move.promotion]
+
+    # Lift each capturing piece off the board so the attackers behind it are found
+    lifted = [(start, position.remove_piece(start))]
+    if victim and position.piece_at(target) is None:
+        # En passant: the captured pawn is not on the target square
+        lifted.append(((start[0], target[1]), position.remove_piece((start[0], target[1]))))
+
+    side = "black" if attacker.color == "white" else "white"
+    while True:
+        attackers = list(position.get_attackers(target, side))
+        if not attackers:
+            break
+        square = min(attackers, key=lambda square: SEE_VALUES[position.piece_at(square).name])
+        piece = position.remove_piece(square)
+        gains.append(on_target - gains[-1])
+        on_target = SEE_VALUES[piece.name]
+        lifted.append((square, piece))
+        side = "black" if side == "white" else "white"
+
+    for square, piece in reversed(lifted):
+        position.put_piece(square, piece)
+
+    # Each side only continues the exchange if it gains by doing so
+    for index in range(len(gains) - 1, 0, -1):
+        gains[index - 1] = -max(-gains[index - 1], gains[index])
+    return gains[0]
+
+
+def mvv_lva(position, move, victim):
+    """
+    Ordering score of a capture or queen promotion: most valuable victim
+    first, then least valuable attacker. Promoting counts as winning a queen.
+    """
+    score = PIECE_VALUES[victim.name] * 10 if victim else 0
+    if move.promotion == "queen":
+        score += PIECE_VALUES["queen"] * 10
+    return score - PIECE_VALUES[position.piece_at(move.start).name]
+
+
+def score_to_table(score, ply):
+    """Make a mate score relative to the current node before storing it"""
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Inverse of score_to_table"""
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+# Search engine of a helper process, created once by the pool initializer
+_helper_engine = None
+
+
+def _init_helper(hash_name, stop_event, max_depth, position_class):
+    global _helper_engine
+    _helper_engine = SearchEngine(max_depth=max_depth, hash_name=hash_name, position_class=position_class)
+    # The main process stops the helpers through the shared event
+    _helper_engine.stopped = stop_event
+
+
+def _warm_up():
+    """Submitted once per worker so the pool starts its processes before the first search"""
+    return os.getpid()
+
+
+def _helper_search(fen, key_history, generation, time_limit, max_depth, helper_id):
+    """Lazy SMP helper: search the root, odd helpers starting one ply deeper"""
+    engine = _helper_engine
+    position = engine.position_class.from_fen(fen)
+    position.key_history = list(key_history)
+    # search() starts a new table generation; make it match the main process
+    engine.tt.generation = (generation - 1) % (MAX_GENERATION + 1)
+    move, score = engine.search(position, time_limit, max_depth, min_depth=1 + helper_id % 2)
+    return move, score, engine.depth, engine.nodes
+
+
+class SearchEngine:
+    def __init__(self, max_depth=64, default_time=1.0, eval_time=0.5, hash_mb=16, shared_hash=False,
+                 move_ordering=True, workers=0, eval_workers=0, hash_name=None, position_class=Position):
+        """
+        workers > 0 starts that many helper processes, sharing the transposition
+        table in shared memory; evaluations use at most eval_workers of them.
+        hash_name attaches to an existing shared table.
+        position_class is the rules backend positions are searched on: Position,
+        or chess_bitboard.BitboardPosition.
+        """
+        self.max_depth = max_depth
+        self.default_time = default_time
+        self.eval_time = eval_time
+        self.move_ordering = move_ordering
+        self.position_class = position_class
+        self.tt = TranspositionTable(hash_mb, shared=shared_hash or workers > 0, name=hash_name)
+        self.nodes = 0
+        self.depth = 0  # Deepest iteration completed by the last search
+        self.pv = []  # Principal variation of the last search
+        self.deadline = None
+        self.interruptible = False
+        self.stop_event = None  # Set by the main process to stop the helpers
+        # Set by stop(); only new_game() or the caller's next request clears it
+        self.stopped = threading.Event()
+
+        self.workers = workers
+        self.eval_workers = min(eval_workers, workers)
+        self.pool = None
+        if workers > 0:
+            # Spawned rather than forked: the GUI process has Tk and engine threads
+            context = multiprocessing.get_context("spawn")
+            self.stop_event = context.Event()
+            self.pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_helper,
+                                            initargs=(self.tt.name, self.stop_event, max_depth, position_class))
+            for _ in range(workers):
+                self.pool.submit(_warm_up)
+        # Quiet moves that caused a cutoff, two per ply
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        # Cutoff counts of quiet moves by side and from/to square
+        self.history = {"white": [0] * 4096, "black": [0] * 4096}
+        # Beta cutoffs in the last search, and how many came from the first move tried
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_game(self):
+        """Forget the table, killers and history learned from earlier positions"""
+        self.tt.clear()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {"white": [0] * 4096, "black": [0] * 4096}
+        self.stopped.clear()
+
+    def stop(self):
+        """
+        Stop the search running in another thread, or the next one if it has
+        not started yet; it returns the best move found so far. Searches stay
+        stopped until new_game() or resume().
+        """
+        self.stopped.set()
+
+    def resume(self):
+        """Let searches run again after stop()"""
+        self.stopped.clear()
+
+    @property
+    def cutoff_rate(self):
+        """Fraction of beta cutoffs produced by the first move searched"""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def search(self, position, time_limit=None, max_depth=None, min_depth=1, workers=None):
+        """
+        Search the position by iterative deepening from min_depth until the
+        time limit runs out, max_depth is completed or the engine is stopped.
+        The first iteration is always completed when it is depth 1. workers
+        limits the helpers taking part (all of them by default).
+        Returns (move, score) with the score in centipawns for the side to move;
+        the move is None when the side to move has no legal moves.
+        """
+        if time_limit is None:
+            time_limit = self.default_time
+        max_depth = max_depth or self.max_depth
+        self.deadline = time.perf_counter() + time_limit
+        self.nodes = 0
+        self.depth = 0
+        self.pv = []
+        self.interruptible = min_depth > 1
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self._age_history()
+
+        moves = list(position.legal_moves())
+        if not moves:
+            return None, self._terminal_score(position, 0)
+        moves = self._order_moves(position, moves, None, 0)
+        workers = self.workers if workers is None else min(workers, self.workers)
+        helpers = self._start_helpers(position, time_limit, max_depth, workers) if self.pool and workers else []
+
+        root_ply = len(position.move_history)
+        best_move, best_score = moves[0], -INFINITY
+        for depth in range(min_depth, max_depth + 1):
+            try:
+                move, score = self._search_root(position, moves, depth)
+            except SearchTimeout:
+                # Unwind the moves the interrupted search left on the board
+                while len(position.move_history) > root_ply:
+                    position.unmake_move(position.move_history[-1])
+                break
+            best_move, best_score = move, score
+            self.depth = depth
+            self.interruptible = True
+            # Search the best move first in the next iteration
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= MATE_SCORE - max_depth or time.perf_counter() >= self.deadline \
+                    or self.stopped.is_set():
+                break
+
+        if helpers:
+            best_move, best_score = self._merge_helpers(helpers, best_move, best_score)
+        self.pv = self.principal_variation(position, best_move)
+        return best_move, best_score
+
+    def _start_helpers(self, position, time_limit, max_depth, workers):
+        """Submit one lazy SMP search of the root to each of the first workers helpers"""
+        self.stop_event.clear()
+        fen = position.board_to_fen()
+        try:
+            return [self.pool.submit(_helper_search, fen, position.key_history, self.tt.generation,
+                                     time_limit, max_depth, helper_id)
+                    for helper_id in range(1, workers + 1)]
+        except BrokenProcessPool as e:
+            # Carry on without helpers rather than failing the move
+            print(f"Error starting helper search: {e}")
+            self.pool = None
+            return []
+
+    def _merge_helpers(self, helpers, best_move, best_score):
+        """Stop the helpers and keep the result of the deepest completed search"""
+        self.stop_event.set()
+        for future in helpers:
+            try:
+                move, score, depth, nodes = future.result()
+            except Exception as e:
+                # A failed helper only loses its share of the search
+                print(f"Error in helper search: {e}")
+                continue
+            self.nodes += nodes
+            if move is not None and depth > self.depth:
+                best_move, best_score, self.depth = move, score, depth
+        return best_move, best_score
+
+    def principal_variation(self, position, move, max_length=32):
+        """The expected line of play starting with move, followed through the hash moves"""
+        pv = []
+        undos = []
+        while move is not None and len(pv) < max_length and move in position.legal_moves():
+            pv.append(move)
+            undos.append(position.make_move(move))
+            entry = self.tt.probe(position.key)
+            move = entry[3] if entry else None
+        for undo in reversed(undos):
+            position.unmake_move(undo)
+        return pv
+
+    def _search_root(self, position, moves, depth):
+        alpha, beta = -INFINITY, INFINITY
+        best_move = moves[0]
+        for move in moves:
+            undo = position.make_move(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, 1)
+            position.unmake_move(undo)
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.tt.store(position.key, depth, EXACT, score_to_table(alpha, 0), best_move)
+        return best_move, alpha
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self._quiescence(position, alpha, beta)
+        self._count_node()
+
+        # A repetition inside the search is scored as a draw
+        if position.halfmove_clock >= 100 or position.repetition_count() > 1:
+            return 0
+
+        hash_move = None
+        entry = self.tt.probe(position.key)
+        if entry:
+            entry_depth, bound, score, hash_move = entry
+            if entry_depth >= depth:
+                score = score_from_table(score, ply)
+                if bound == EXACT or (bound == LOWER_BOUND and score >= beta) \
+                        or (bound == UPPER_BOUND and score <= alpha):
+                    return score
+
+        moves = position.legal_moves()
+        if not moves:
+            return self._terminal_score(position, ply)
+        moves = self._order_moves(position, moves, hash_move, ply)
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, None
+        for index, move in enumerate(moves):
+            undo = position.make_move(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move(undo)
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        self._record_cutoff(position, move, depth, ply, index)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER_BOUND
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            # No move raised alpha, so none of them is known to be best
+            bound, best_move = UPPER_BOUND, None
+        self.tt.store(position.key, depth, bound, score_to_table(best_score, ply), best_move)
+        return best_score
+
+    def _quiescence(self, position, alpha, beta):
+        """
+        Search only captures and queen promotions until the position is quiet,
+        using the static evaluation as the score for standing pat.
+        """
+        self._count_node()
+        if position.halfmove_clock >= 100 or position.repetition_count() > 1:
+            return 0
+
+        best_score = self._static_score(position)
+        if best_score >= beta:
+            return best_score
+        alpha = max(alpha, best_score)
+
+        captures = []
+        for move in position.generate_pseudo_legal_moves():
+            if move.promotion and move.promotion != "queen":
+                continue
+            victim = position.captured_piece(move)
+            if victim or move.promotion:
+                captures.append((mvv_lva(position, move, victim), move))
+        captures.sort(key=lambda capture: capture[0], reverse=True)
+
+        for _, move in captures:
+            if static_exchange(position, move) < 0 or not position.is_legal(move):
+                continue
+            undo = position.make_move(move)
+            score = -self._quiescence(position, -beta, -alpha)
+            position.unmake_move(undo)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def _count_node(self):
+        """Count a node, stopping the search once the time is up or it is told to stop"""
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self.interruptible \
+                and (time.perf_counter() >= self.deadline or self.stopped.is_set()):
+            raise SearchTimeout
+
+    def _order_moves(self, position, moves, hash_move, ply):
+        """Return the moves sorted so the likeliest cutoffs are searched first"""
+        if not self.move_ordering:
+            if hash_move in moves:
+                return [hash_move] + [move for move in moves if move != hash_move]
+            return moves
+
+        killers = self.killers[ply]
+        history = self.history[position.current_player]
+
+        def priority(move):
+            if move == hash_move:
+                return HASH_MOVE_PRIORITY
+            (start_row, start_col), (end_row, end_col) = move.start, move.end
+            victim = position.captured_piece(move)
+            if victim or move.promotion == "queen":
+                return CAPTURE_PRIORITY + mvv_lva(position, move, victim)
+            if move == killers[0]:
+                return KILLER_PRIORITY + 1
+            if move == killers[1]:
+                return KILLER_PRIORITY
+            if move.promotion:
+                # Underpromotions are rarely useful
+                return -1
+            return history[(start_row * 8 + start_col) * 64 + end_row * 8 + end_col]
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _record_cutoff(self, position, move, depth, ply, index):
+        """Update the cutoff statistics, and the killers and history for a quiet move"""
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if position.captured_piece(move) or move.promotion:
+            return
+
+        killers = self.killers[ply]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+        (start_row, start_col), (end_row, end_col) = move.start, move.end
+        history = self.history[position.current_player]
+        slot = (start_row * 8 + start_col) * 64 + end_row * 8 + end_col
+        history[slot] += depth * depth
+        if history[slot] >= HISTORY_LIMIT:
+            self._age_history()
+
+    def _age_history(self):
+        """Halve the history scores so recent cutoffs weigh more"""
+        for history in self.history.values():
+            history[:] = [score // 2 for score in history]
+
+    @staticmethod
+    def _static_score(position):
+        """Static evaluation from the side to move's point of view"""
+        score = position.evaluate()
+        return int(score if position.current_player == "white" else -score)
+
+    @staticmethod
+    def _terminal_score(position, ply):
+        """Score of a position without legal moves: mated, preferring the longest mate, or stalemate"""
+        if position.is_in_check(position.current_player):
+            return -(MATE_SCORE - ply)
+        return 0
+
+    def get_best_move(self, board_fen, time_limit=None, max_depth=None):
+        """Best move for the position as a chess.Move, or None if there is none"""
+        position = self.position_class.from_fen(board_fen)
+        move, score = self.search(position, time_limit, max_depth)
+        if move is None:
+            return None
+        return chess.Move.from_uci(move_to_uci(move))
+
+    def get_position_evaluation(self, board_fen):
+        """Evaluation in pawns for the side to move, like ChessEngine"""
+        position = self.position_class.from_fen(board_fen)
+        move, score = self.search(position, self.eval_time, workers=self.eval_workers)
+        return score / 100
+
+    def close(self):
+        """Stop the helper processes and release the transposition table"""
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.tt:
+            self.tt.close()
+            self.tt = None
+
+
+def main(argv=None):
+    # Imported here: perft imports the bitboard backend, which the engine does not need
+    from perft import BACKENDS, PERFT_SUITE
+
+    parser = argparse.ArgumentParser(description="Nodes-to-depth benchmark for the built-in engine")
+    parser.add_argument("--depth", type=int, default=4, help="search depth")
+    parser.add_argument("--fen", help="search a single position instead of the perft suite")
+    parser.add_argument("--no-ordering", action="store_true", help="disable move ordering")
+    parser.add_argument("--workers", type=int, default=0, help="number of helper processes")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="list", help="rules backend to search on")
+    args = parser.parse_args(argv)
+
+    positions = [("fen", args.fen)] if args.fen else [(name, fen) for name, fen, _ in PERFT_SUITE]
+    total_nodes = 0
+    total_time = 0.0
+    position_class = BACKENDS[args.backend]
+    engine = SearchEngine(move_ordering=not args.no_ordering, workers=args.workers, position_class=position_class)
+    for name, fen in positions:
+        engine.new_game()
+        start = time.perf_counter()
+        move, score = engine.search(position_class.from_fen(fen), time_limit=float("inf"), max_depth=args.depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += engine.nodes
+        total_time += elapsed
+        print(f"{name:<10} depth {engine.depth}  {move_to_uci(move) if move else '-':<6} {score:>7}  "
+              f"{engine.nodes:>9} nodes  {elapsed:7.2f}s  first-move cutoffs {engine.cutoff_rate:.1%}  "
+              f"hashfull {engine.tt.hashfull()}")
+    print(f"total      {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nps "
+          f"({args.backend} backend)")
+    engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Syzygy endgame tablebase probing.
+
+With a directory of Syzygy tables (.rtbw/.rtbz files), positions with few
+enough pieces have a known result: the tablebase supplies the best move and
+the evaluation without any search. Probe results are kept in an LRU cache,
+since the same endgame positions come up again on every redraw and move.
+Probes read the table files, so the game runs them through ChessEngine on
+the engine loop's worker threads rather than on the Tk thread.
+"""
+
+import functools
+
+import chess
+import chess.syzygy
+
+# Evaluation, in pawns for the side to move, of each win/draw/loss value.
+# Cursed wins and blessed losses are drawn under the fifty-move rule.
+WDL_EVALUATIONS = {2: 100.0, 1: 0.0, 0: 0.0, -1: 0.0, -2: -100.0}
+
+
+class Tablebase:
+    def __init__(self, directory, cache_size=65536):
+        self.tablebase = chess.syzygy.open_tablebase(directory)
+        # Table names such as "KQvKR" list every piece, plus the "v"
+        self.max_pieces = max((len(name) - 1 for name in self.tablebase.wdl), default=0)
+        self._probe_fen = functools.lru_cache(maxsize=cache_size)(self._probe_fen)
+
+    def _probe_fen(self, fen):
+        board = chess.Board(fen)
+        try:
+            wdl = self.tablebase.probe_wdl(board)
+        except KeyError:
+            # MissingTableError: this material combination is not installed
+            return None
+        try:
+            dtz = self.tablebase.probe_dtz(board)
+        except KeyError:
+            # Only the WDL table is installed: the result is known, the distance is not
+            dtz = None
+        return wdl, dtz
+
+    def probe(self, position):
+        """
+        Return (wdl, dtz) for the side to move, or None when the position is
+        not covered: too many pieces, castling rights, or a missing table.
+        dtz is None when only the WDL table of the position is installed.
+        """
+        if position.castling_rights:
+            return None
+        pieces = sum(1 for row in position.board for piece in row if piece)
+        if pieces > self.max_pieces:
+            return None
+        # The result does not depend on the move counters, so they are left out of the cache key
+        return self._probe_fen(" ".join(position.board_to_fen().split()[:4]))
+
+    def best_move(self, position):
+        """
+        The move that keeps the best result: mate if available, otherwise the
+        fastest win by distance to zeroing, or the longest resistance when
+        lost. None if the position is not covered, or without the DTZ tables
+        to tell progress from shuffling.
+        """
+        if self.probe(position) is None:
+            return None
+        best_move, best_rank = None, None
+        for move in position.legal_moves():
+            undo = position.make_move(move)
+            result = self.probe(position)
+            zeroing = position.halfmove_clock == 0
+            mate = not position.legal_moves() and position.is_in_check(position.current_player)
+            position.unmake_move(undo)
+            if result is None or result[1] is None:
+                return None
+            wdl, dtz = -result[0], -result[1]
+            if wdl > 0:
+                # Win: mate, else reset the fifty-move count, else head for the quickest zeroing
+                rank = (wdl, mate, zeroing, -abs(dtz))
+            else:
+                rank = (wdl, False, False, abs(dtz))
+            if best_rank is None or rank > best_rank:
+                best_move, best_rank = move, rank
+        return best_move
+
+    def evaluate(self, position):
+        """Evaluation in pawns for the side to move, or None if not covered"""
+        result = self.probe(position)
+        if result is None:
+            return None
+        return WDL_EVALUATIONS[result[0]]
+
+    def cache_info(self):
+        """Hits, misses and size of the probe cache"""
+        return self._probe_fen.cache_info()
+
+    def close(self):
+        self.tablebase.close()
+        self._probe_fen.cache_clear()
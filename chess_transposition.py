@@ -0,0 +1,133 @@
+"""
+Fixed-size transposition table for the built-in search.
+
+Entries live in one preallocated buffer, so memory use is capped by the size
+given in MB no matter how long the search runs. Each bucket holds two 16-byte
+entries: a depth-preferred slot that keeps the deepest result of the current
+search, and an always-replace slot for everything else.
+
+The buffer can be placed in multiprocessing.shared_memory so that worker
+processes share one table. Writes are not locked; every entry stores its key
+XORed with its data, so an entry torn by a concurrent write fails the key
+check and reads as a miss.
+"""
+
+import struct
+from multiprocessing import shared_memory
+
+from chess_rules import Move, PROMOTION_PIECES
+
+# Bound types of a stored score
+EXACT = 1
+LOWER_BOUND = 2  # The search failed high: the true score is at least this
+UPPER_BOUND = 3  # The search failed low: the true score is at most this
+
+ENTRY = struct.Struct("<QQ")  # key ^ data, data
+BUCKET_ENTRIES = 2
+BUCKET_SIZE = ENTRY.size * BUCKET_ENTRIES
+
+# Promotion piece codes in the packed move; 0 is no promotion
+PROMOTION_CODES = {name: code for code, name in enumerate(PROMOTION_PIECES, 1)}
+MAX_GENERATION = 63  # The generation shares a byte with the bound type
+
+
+def encode_move(move):
+    """Pack a Move into 16 bits (0 means no move)"""
+    if move is None:
+        return 0
+    (start_row, start_col), (end_row, end_col) = move.start, move.end
+    return ((start_row * 8 + start_col) | (end_row * 8 + end_col) << 6
+            | PROMOTION_CODES.get(move.promotion, 0) << 12)
+
+
+def decode_move(code):
+    """Unpack a move from encode_move, or None"""
+    if not code:
+        return None
+    start, end, promotion = code & 63, code >> 6 & 63, code >> 12
+    return Move(divmod(start, 8), divmod(end, 8),
+                PROMOTION_PIECES[promotion - 1] if promotion else None)
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, shared=False, name=None):
+        """
+        Create a table of size_mb megabytes. With shared=True the buffer is a
+        new shared memory block; with name it attaches to an existing block
+        created by another process.
+        """
+        self.shm = None
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+        elif shared:
+            size = max(1, int(size_mb * 1024 * 1024) // BUCKET_SIZE) * BUCKET_SIZE
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        if self.shm:
+            self.buffer = self.shm.buf
+            self.owner = name is None
+        else:
+            self.buffer = bytearray(max(1, int(size_mb * 1024 * 1024) // BUCKET_SIZE) * BUCKET_SIZE)
+            self.owner = True
+        # Shared memory blocks may be rounded up to the page size
+        self.bucket_count = len(self.buffer) // BUCKET_SIZE
+        self.generation = 0
+
+    @property
+    def name(self):
+        """Name of the shared memory block, for attaching from another process"""
+        return self.shm.name if self.shm else None
+
+    def new_search(self):
+        """Start a new generation, so entries from earlier searches are replaced first"""
+        self.generation = (self.generation + 1) % (MAX_GENERATION + 1)
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.generation = 0
+
+    def probe(self, key):
+        """Return (depth, bound, score, move) stored for the key, or None"""
+        offset = key % self.bucket_count * BUCKET_SIZE
+        for _ in range(BUCKET_ENTRIES):
+            checked_key, data = ENTRY.unpack_from(self.buffer, offset)
+            if data and checked_key ^ data == key:
+                return (data >> 8 & 0xFF, data & 3, (data >> 32) - 0x80000000,
+                        decode_move(data >> 16 & 0xFFFF))
+            offset += ENTRY.size
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Store a search result, keeping the deepest entry of the current search"""
+        offset = key % self.bucket_count * BUCKET_SIZE
+        data = ((score + 0x80000000) << 32 | encode_move(move) << 16
+                | min(depth, 255) << 8 | self.generation << 2 | bound)
+        checked_key, stored = ENTRY.unpack_from(self.buffer, offset)
+        stored_generation = stored >> 2 & MAX_GENERATION
+        if not stored or checked_key ^ stored == key or depth >= (stored >> 8 & 0xFF) \
+                or stored_generation != self.generation:
+            if not move and stored and checked_key ^ stored == key:
+                # Keep the best move of an earlier search of the same position
+                data |= stored & 0xFFFF0000
+            ENTRY.pack_into(self.buffer, offset, key ^ data, data)
+        else:
+            ENTRY.pack_into(self.buffer, offset + ENTRY.size, key ^ data, data)
+
+    def hashfull(self):
+        """Permille of depth-preferred slots used in the current search, from a sample"""
+        sample = min(1000, self.bucket_count)
+        used = 0
+        for bucket in range(sample):
+            _, data = ENTRY.unpack_from(self.buffer, bucket * BUCKET_SIZE)
+            if data and data >> 2 & MAX_GENERATION == self.generation:
+                used += 1
+        return used * 1000 // sample
+
+    def close(self):
+        """Release the buffer; the creating process also frees shared memory"""
+        if self.shm:
+            self.buffer.release()
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+        self.buffer = None
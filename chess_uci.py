@@ -0,0 +1,567 @@
+"""
+Asynchronous UCI engine client.
+
+Engines are driven through python-chess's asyncio protocol on a single event
+loop thread shared by every game, so the Tk thread never blocks on an engine.
+Each request runs as a task on that loop with an optional deadline and can
+be cancelled: cancelling a search sends "stop" at once, and the engine is
+ready for the next request. Engine processes are kept warm in a pool and
+reused by later games.
+"""
+
+import asyncio
+import atexit
+import os
+import shutil
+import threading
+from collections import OrderedDict, namedtuple
+
+import chess
+import chess.engine
+
+from chess_bitboard import BitboardPosition
+from chess_rules import Position, move_to_uci
+from chess_search import MATE_SCORE, SearchEngine
+
+# Bundled engine binaries, looked for in the stockfish folder next to the game
+BUNDLED_ENGINES = ("stockfish-windows-x86-64-sse41-popcnt.exe", "stockfish.exe", "stockfish")
+
+# Extra time a move request may take beyond its search time, for engine startup
+MOVE_DEADLINE_MARGIN = 10.0
+
+# Seconds between the analysis updates passed on to the caller
+ANALYSIS_INTERVAL = 0.1
+
+# An engine evaluation: score in pawns for the side to move, search depth, best move
+Evaluation = namedtuple("Evaluation", "score depth best_move")
+# An analysis update: depth, score in pawns (positive for white), principal variation, nodes per second
+AnalysisInfo = namedtuple("AnalysisInfo", "depth score pv nps")
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+def find_engine_binary():
+    """
+    Locate a UCI engine: the CHESS_ENGINE environment variable (a path or a
+    command on the PATH), then a Stockfish bundled in the stockfish folder,
+    then stockfish on the PATH. Returns None if there is none.
+    """
+    configured = os.environ.get("CHESS_ENGINE")
+    if configured:
+        return configured if os.path.isfile(configured) else shutil.which(configured)
+    bundled_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stockfish")
+    for name in BUNDLED_ENGINES:
+        path = os.path.join(bundled_dir, name)
+        if os.path.isfile(path):
+            return path
+    return shutil.which("stockfish")
+
+
+class EngineLoop:
+    """The event loop thread that all engine requests run on, started on first use"""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.loop is not None
+
+    def start(self):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The engine loop has been closed")
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="engine-loop", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop; returns a concurrent.futures.Future for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def close(self):
+        """Stop the loop thread for good"""
+        with self.lock:
+            loop, self.loop = self.loop, None
+            self.closed = True
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            self.thread.join(timeout=5)
+            loop.close()
+
+
+class EnginePool:
+    """
+    Warm UCI engine processes shared by every game. A game leases an engine
+    and returns it when it ends; the engine is reset with ucinewgame and kept
+    for the next game instead of being killed and started again. All methods
+    are coroutines for the engine loop.
+    """
+
+    # Options a game changes for its difficulty, restored when the engine is returned
+    RESET_OPTIONS = ("Skill Level", "UCI_LimitStrength", "UCI_Elo")
+
+    def __init__(self, engine_path, max_engines=None):
+        self.engine_path = engine_path
+        # At most one engine process per core
+        self.max_engines = max_engines or os.cpu_count() or 1
+        self.idle = []
+        self.leased = 0
+
+    async def acquire(self):
+        """Lease an idle engine, or start one. Returns None when every allowed engine is in use."""
+        while self.idle:
+            engine = self.idle.pop()
+            if not engine.returncode.done():
+                self.leased += 1
+                return engine
+        if self.leased >= self.max_engines:
+            return None
+        self.leased += 1
+        try:
+            _, engine = await chess.engine.popen_uci(self.engine_path)
+        except BaseException:
+            self.leased -= 1
+            raise
+        return engine
+
+    async def release(self, engine):
+        """Reset an engine for a new game and keep it for the next lease"""
+        self.leased -= 1
+        try:
+            await engine.configure({name: engine.options[name].default for name in self.RESET_OPTIONS
+                                    if name in engine.options and engine.options[name].default is not None})
+            engine.send_line("ucinewgame")
+            await engine.ping()  # Wait until the engine has finished resetting
+        except Exception as e:
+            print(f"Warning: Discarding engine that failed to reset: {e}")
+            if not engine.returncode.done():
+                engine.transport.kill()
+            return
+        self.idle.append(engine)
+
+    async def close(self):
+        """Quit the idle engines"""
+        engines, self.idle = self.idle, []
+        for engine in engines:
+            try:
+                await engine.quit()
+            except Exception as e:
+                print(f"Warning: Error quitting engine: {e}")
+
+
+class EvaluationCache:
+    """
+    Bounded LRU cache of engine evaluations by position. An entry answers any
+    request no deeper than the depth it was searched to, so positions seen
+    again after undo, repetitions or another review pass are not re-searched.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(board):
+        """The position without the move counters, which do not change the evaluation"""
+        return board.epd()
+
+    def get(self, board, depth):
+        """The cached Evaluation searched to at least depth, or None"""
+        key = self.key(board)
+        entry = self.entries.get(key)
+        if entry is None or entry.depth < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, board, evaluation):
+        key = self.key(board)
+        entry = self.entries.get(key)
+        if entry is None or evaluation.depth >= entry.depth:
+            self.entries[key] = evaluation
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def cache_info(self):
+        """Hits, misses and size of the cache"""
+        return CacheInfo(self.hits, self.misses, self.max_entries, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
+class FallbackSearch:
+    """
+    The built-in search engine, shared by every game that has no UCI engine.
+    It searches on the bitboard backend. It is started, with a helper process
+    on every other core, when a game first falls back to it, and runs one
+    search at a time until exit. Moves are searched with every helper, while
+    evaluations for the evaluation bar leave the other cores alone.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = max(0, (os.cpu_count() or 1) - 1) if workers is None else workers
+        self.engine = None
+        self.lock = threading.Lock()
+        self.search_lock = None  # Created on the engine loop
+
+    def start(self):
+        """Create the search engine and its helpers, if not already; blocks while they spawn"""
+        with self.lock:
+            if self.engine is None:
+                self.engine = SearchEngine(workers=self.workers, eval_workers=0, position_class=BitboardPosition)
+            return self.engine
+
+    async def run(self, search):
+        """Run search(engine) in a worker thread, stopping it if the request is cancelled"""
+        if self.search_lock is None:
+            self.search_lock = asyncio.Lock()
+        async with self.search_lock:
+            loop = asyncio.get_running_loop()
+            engine = await loop.run_in_executor(None, self.start)
+            # Cleared here on the loop, so a cancel arriving before the search starts still stops it
+            engine.resume()
+            future = loop.run_in_executor(None, search, engine)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                engine.stop()
+                # Let the search unwind before the next one may start
+                await asyncio.wait([future])
+                raise
+
+    def close(self):
+        """Stop the helper processes"""
+        with self.lock:
+            engine, self.engine = self.engine, None
+        if engine is not None:
+            engine.close()
+
+
+ENGINE_LOOP = EngineLoop()
+ENGINE_POOL = EnginePool(find_engine_binary())
+FALLBACK_SEARCH = FallbackSearch()
+
+
+@atexit.register
+def _close_engines():
+    if ENGINE_LOOP.running:
+        try:
+            ENGINE_LOOP.submit(ENGINE_POOL.close()).result(timeout=5)
+        except Exception as e:
+            print(f"Warning: Error closing engines: {e}")
+        ENGINE_LOOP.close()
+    FALLBACK_SEARCH.close()
+
+
+class ChessEngine:
+    """
+    UCI engine client for one game. Nothing is started until the engine is
+    first needed: start() leases it from the pool on the engine loop and
+    returns the ready future. play(), evaluate() and analyse() take a
+    chess.Board with the moves of the game, which the engine receives as
+    "position startpos moves ...", and return futures that can be cancelled.
+    Every command carries the token of the current game, so the engine
+    keeps its hash between moves and only gets ucinewgame after new_game().
+    When no engine can be started, the built-in search shared by every game
+    answers instead. With a tablebase, endgames it covers are answered from
+    the tables, probed in a worker thread, before the engine is asked.
+
+    With ponder=True the engine keeps thinking on the reply it expects after
+    each move it plays. If that reply is played, the next play() turns the
+    ponder search into the real one with "ponderhit" and answers almost at
+    once; any other position stops the ponder search and starts afresh.
+    """
+
+    def __init__(self, depth=20, pool=None, loop=None, ponder=False, eval_cache_size=4096, fallback=None,
+                 tablebase=None):
+        self.depth = depth
+        self.ponder = ponder
+        self.ponder_board = None  # Position the engine is pondering, with the moves leading to it
+        self.game_id = object()  # python-chess sends ucinewgame whenever the game token changes
+        self.engine = None
+        self.engine_lock = None  # Created on the loop: python-chess queues only one command behind the running one
+        self.pool = pool or ENGINE_POOL
+        self.loop = loop or ENGINE_LOOP
+        self.engine_path = self.pool.engine_path
+        self.ready = None
+        self.options = {}
+        self.fallback = fallback or FALLBACK_SEARCH
+        self.fallback_depth = None  # Strength limits for the built-in search, see limit_fallback()
+        self.fallback_time = None
+        self.tablebase = tablebase
+        self.tasks = set()  # Requests running on the loop
+        self.evaluations = EvaluationCache(eval_cache_size)  # Only used on the loop
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start leasing the engine in the background, if not already, and return the ready future"""
+        with self.lock:
+            if self.ready is None:
+                self.ready = self.loop.submit(self._start())
+            return self.ready
+
+    async def _started(self):
+        """The engine once started, or None; cancelling the request must not cancel the shared start"""
+        return await asyncio.shield(asyncio.wrap_future(self.start()))
+
+    async def _start(self):
+        engine = None
+        if not self.engine_path:
+            # Not an error: the built-in search engine plays instead
+            print("No UCI engine found, using the built-in search engine")
+        else:
+            try:
+                engine = await self.pool.acquire()
+                if engine is None:
+                    print("All engine processes are in use")
+                else:
+                    print("Chess engine leased successfully")
+            except Exception as e:
+                print(f"Error initializing engine: {e}")
+        if not self.engine_path:
+            # Spawn the built-in search's helpers now rather than on the first search. Not
+            # when the pool is only busy: an analyser that finds no engine free never searches
+            asyncio.get_running_loop().run_in_executor(None, self.fallback.start)
+
+        if engine:
+            self.engine = engine
+            self.engine_lock = asyncio.Lock()
+            try:
+                if self.options:
+                    await engine.configure(self.options)
+            except Exception as e:
+                print(f"Error configuring engine: {e}")
+        return engine
+
+    def configure(self, options):
+        """Set UCI options now, or as soon as the engine has started"""
+        return self.loop.submit(self._configure(options))
+
+    async def _configure(self, options):
+        self.options.update(options)
+        if self.engine:
+            async with self.engine_lock:
+                await self.engine.configure(options)
+
+    def limit_fallback(self, depth=None, time_limit=None):
+        """
+        Cap the depth and seconds per move of the built-in search, which has
+        no UCI strength options; None leaves that limit off.
+        """
+        self.fallback_depth = depth
+        self.fallback_time = time_limit
+
+    def submit(self, coroutine, deadline=None):
+        """
+        Run a request on the engine loop, giving up after deadline seconds.
+        Returns a concurrent.futures.Future; cancelling it stops the request.
+        """
+        return self.loop.submit(self._run(coroutine, deadline))
+
+    async def _run(self, coroutine, deadline):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await asyncio.wait_for(coroutine, deadline)
+        finally:
+            self.tasks.discard(task)
+
+    def play(self, board, time_limit=None, deadline=None):
+        """Search for the best move in the background; the future's result is a chess.Move or None"""
+        if time_limit is None:
+            time_limit = 1.0  # Default to 1 second
+        if deadline is None:
+            deadline = time_limit + MOVE_DEADLINE_MARGIN
+        # A copy, since the caller goes on pushing moves while the engine thinks
+        return self.submit(self._play(board.copy(), time_limit), deadline)
+
+    async def _play(self, board, time_limit):
+        if self.tablebase is not None:
+            move = await self._in_tablebase(self.tablebase.best_move, board)
+            if move:
+                await self._stop_pondering()
+                return chess.Move.from_uci(move_to_uci(move))
+        engine = await self._started()
+        if not engine:
+            if self.fallback_time is not None:
+                time_limit = min(time_limit, self.fallback_time)
+            return await self.fallback.run(
+                lambda fallback: fallback.get_best_move(board.fen(), time_limit, self.fallback_depth))
+        # python-chess sends ponderhit when the board continues the pondered line
+        self.ponder_board = None
+        async with self.engine_lock:
+            result = await engine.play(board, chess.engine.Limit(time=time_limit), game=self.game_id, ponder=self.ponder)
+        if self.ponder and result.move and result.ponder:
+            # The engine is now thinking on the expected reply
+            self.ponder_board = board.copy()
+            self.ponder_board.push(result.move)
+            self.ponder_board.push(result.ponder)
+        return result.move
+
+    def is_ponder_hit(self, board):
+        """Whether the engine is pondering this position"""
+        ponder_board = self.ponder_board
+        return ponder_board is not None and ponder_board.move_stack == board.move_stack
+
+    def new_game(self):
+        """Start a new game: the next command sends ucinewgame, and pondering stops"""
+        self.game_id = object()
+        self.stop_pondering()
+
+    def stop_pondering(self):
+        """Stop the ponder search, when the game moves away from the expected line"""
+        if self.ponder_board is not None:
+            self.loop.submit(self._stop_pondering())
+
+    async def _stop_pondering(self):
+        if self.ponder_board is not None and self.engine:
+            self.ponder_board = None
+            # Any new command stops the ponder search
+            async with self.engine_lock:
+                await self.engine.ping()
+
+    def evaluate(self, board, depth=None, deadline=None):
+        """
+        Evaluate the position in the background to depth (self.depth by
+        default); the future's result is in pawns for the side to move.
+        Positions already searched at least as deep come from the cache.
+        """
+        return self.submit(self._evaluate(board.copy(), depth or self.depth), deadline)
+
+    async def _evaluate(self, board, depth):
+        cached = self.evaluations.get(board, depth)
+        if cached:
+            return cached.score
+        if self.tablebase is not None:
+            score = await self._in_tablebase(self.tablebase.evaluate, board)
+            if score is not None:
+                return score
+        engine = await self._started()
+        if not engine:
+            return await self.fallback.run(lambda fallback: fallback.get_position_evaluation(board.fen()))
+        async with self.engine_lock:
+            info = await engine.analyse(board, chess.engine.Limit(depth=depth), game=self.game_id)
+        score = info["score"].relative.score(mate_score=MATE_SCORE) / 100  # Convert centipawns to pawns
+        pv = info.get("pv")
+        self.evaluations.put(board, Evaluation(score, info.get("depth", depth), pv[0] if pv else None))
+        return score
+
+    def probe_tablebase(self, board):
+        """
+        Look the position up in the tablebase in the background; the future's
+        result is in pawns for the side to move, or None if it is not covered.
+        """
+        return self.submit(self._in_tablebase(self.tablebase.evaluate, board.copy()))
+
+    async def _in_tablebase(self, lookup, board):
+        """Run a tablebase lookup in a worker thread, since probes read the table files"""
+        position = Position.from_fen(board.fen())
+        return await asyncio.get_running_loop().run_in_executor(None, lookup, position)
+
+    def analyse(self, board, on_info, depth=None, interval=ANALYSIS_INTERVAL):
+        """
+        Stream analysis of the position in the background, searching to depth
+        (self.depth by default). on_info(AnalysisInfo) is called on the engine
+        loop with the latest line, at most once per interval seconds, and once
+        more with the final line. Cancel the returned future to stop.
+        """
+        return self.submit(self._analyse(board.copy(), on_info, depth or self.depth, interval))
+
+    async def _analyse(self, board, on_info, depth, interval):
+        cached = self.evaluations.get(board, depth)
+        if cached:
+            score = cached.score if board.turn == chess.WHITE else -cached.score
+            on_info(AnalysisInfo(cached.depth, score, [cached.best_move] if cached.best_move else [], None))
+            return cached
+        engine = await self._started()
+        if not engine:
+            return None  # The built-in search does not stream; the caller keeps its own evaluation
+
+        loop = asyncio.get_running_loop()
+        latest, sent_at = None, 0.0
+        async with self.engine_lock:
+            with await engine.analysis(board, chess.engine.Limit(depth=depth), game=self.game_id) as analysis:
+                while True:
+                    # Wait for the next line, or until the held one is due
+                    timeout = None if latest is None else max(0.0, sent_at + interval - loop.time())
+                    try:
+                        info = await asyncio.wait_for(analysis.get(), timeout)
+                    except asyncio.TimeoutError:
+                        info = {}
+                    except chess.engine.AnalysisComplete:
+                        break
+                    if "score" in info:
+                        latest = AnalysisInfo(info.get("depth", 0), info["score"].white().score(mate_score=MATE_SCORE) / 100,
+                                              info.get("pv", []), info.get("nps"))
+                    if latest is not None and loop.time() >= sent_at + interval:
+                        on_info(latest)
+                        latest, sent_at = None, loop.time()
+                final = analysis.info
+        if latest is not None:
+            on_info(latest)
+
+        if "score" not in final:
+            return None
+        pv = final.get("pv")
+        evaluation = Evaluation(final["score"].relative.score(mate_score=MATE_SCORE) / 100,
+                                final.get("depth", depth), pv[0] if pv else None)
+        self.evaluations.put(board, evaluation)
+        return evaluation
+
+    def cache_info(self):
+        """Hits, misses and size of the evaluation cache"""
+        return self.evaluations.cache_info()
+
+    def get_best_move(self, board, time_limit=None):
+        """Blocking form of play(), for callers off the Tk thread"""
+        try:
+            return self.play(board, time_limit).result()
+        except Exception as e:
+            print(f"Error getting best move: {e}")
+            return None
+
+    def get_position_evaluation(self, board, depth=None):
+        """Blocking form of evaluate(), for callers off the Tk thread"""
+        try:
+            return self.evaluate(board, depth).result()
+        except Exception as e:
+            print(f"Error getting evaluation: {e}")
+            return None
+
+    def close(self):
+        """
+        Cancel the requests in progress and return the engine to the pool.
+        Does not block: the engine loop finishes the cleanup.
+        """
+        with self.lock:
+            ready, self.ready = self.ready, None
+        if not self.loop.running:
+            return  # Nothing was started, or the loop was shut down at exit with its engines
+        if ready is not None:
+            self.loop.submit(self._close(ready))
+
+    async def _close(self, ready):
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        engine = await asyncio.wrap_future(ready)
+        self.engine = None
+        if engine:
+            try:
+                async with self.engine_lock:  # After any ponder stop still on its way
+                    await self.pool.release(engine)
+            except Exception as e:
+                print(f"Warning: Error returning engine: {e}")
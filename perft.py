@@ -0,0 +1,167 @@
+"""
+Perft: count the leaf nodes of the legal move tree to check and time the rules core.
+
+    python perft.py                                # standard suite to depth 3
+    python perft.py --depth 4 --backend bitboard   # deeper, on the bitboard backend
+    python perft.py --fen "<fen>" --depth 3 --divide --cross-check
+
+Node counts are compared against the published values for the standard
+positions and, with --cross-check, against python-chess move by move.
+The exit status is non-zero when any count is wrong.
+"""
+
+import argparse
+import sys
+import time
+
+import chess
+
+from chess_bitboard import BitboardPosition
+from chess_rules import START_FEN, Position, move_to_uci
+
+BACKENDS = {"list": Position, "bitboard": BitboardPosition}
+
+# Standard test positions with their known node counts for depth 1, 2, ...
+PERFT_SUITE = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft(position, depth):
+    """Count the leaf nodes of the legal move tree to the given depth"""
+    if depth == 0:
+        return 1
+    moves = list(position.generate_legal_moves())
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(undo)
+    return nodes
+
+
+def divide(position, depth):
+    """Perft split by root move, as {uci: nodes}"""
+    result = {}
+    for move in list(position.generate_legal_moves()):
+        undo = position.make_move(move)
+        result[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move(undo)
+    return result
+
+
+def _reference_perft(board, depth):
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += _reference_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def reference_divide(fen, depth):
+    """The same split as divide, computed by python-chess"""
+    board = chess.Board(fen)
+    result = {}
+    for move in board.legal_moves:
+        board.push(move)
+        result[move.uci()] = _reference_perft(board, depth - 1)
+        board.pop()
+    return result
+
+
+def cross_check(fen, depth, backend="list"):
+    """
+    Compare divide against python-chess.
+    Returns {uci: (ours, reference)} for every root move whose count differs.
+    """
+    ours = divide(BACKENDS[backend].from_fen(fen), depth)
+    reference = reference_divide(fen, depth)
+    return {uci: (ours.get(uci), reference.get(uci))
+            for uci in set(ours) | set(reference)
+            if ours.get(uci) != reference.get(uci)}
+
+
+def run_suite(max_depth=3, backend="list", check_reference=False):
+    """Run the standard positions, printing nodes and nodes/sec. Returns True if all counts match."""
+    all_ok = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in PERFT_SUITE:
+        depth = min(max_depth, len(counts))
+        position = BACKENDS[backend].from_fen(fen)
+        start = time.perf_counter()
+        nodes = perft(position, depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+
+        ok = nodes == counts[depth - 1]
+        status = "ok" if ok else f"FAIL (expected {counts[depth - 1]})"
+        print(f"{name:<10} depth {depth}  {nodes:>10} nodes  {elapsed:7.2f}s  "
+              f"{nodes / max(elapsed, 1e-9):>9.0f} nps  {status}")
+
+        if check_reference:
+            mismatches = cross_check(fen, depth, backend)
+            for uci, (mine, theirs) in sorted(mismatches.items()):
+                print(f"    {uci}: {mine} vs python-chess {theirs}")
+            ok = ok and not mismatches
+        all_ok = all_ok and ok
+
+    print(f"total      {total_nodes} nodes in {total_time:.2f}s, "
+          f"{total_nodes / max(total_time, 1e-9):.0f} nps ({backend} backend)")
+    return all_ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness and speed check for the rules core")
+    parser.add_argument("--depth", type=int, default=3, help="search depth (suite: maximum depth)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="list")
+    parser.add_argument("--fen", help="run a single position instead of the standard suite")
+    parser.add_argument("--divide", action="store_true", help="print the node count of each root move")
+    parser.add_argument("--cross-check", action="store_true", help="compare against python-chess")
+    args = parser.parse_args(argv)
+
+    if not args.fen:
+        return 0 if run_suite(args.depth, args.backend, args.cross_check) else 1
+
+    position = BACKENDS[args.backend].from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        split = divide(position, args.depth)
+        for uci in sorted(split):
+            print(f"{uci}: {split[uci]}")
+        nodes = sum(split.values())
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"nodes {nodes}  time {elapsed:.2f}s  {nodes / max(elapsed, 1e-9):.0f} nps")
+
+    if args.cross_check:
+        mismatches = cross_check(args.fen, args.depth, args.backend)
+        for uci, (mine, theirs) in sorted(mismatches.items()):
+            print(f"mismatch {uci}: {mine} vs python-chess {theirs}")
+        if mismatches:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())